@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """S3 Uploader - 新しいエントリーポイント"""
 from s3_uploader import S3Uploader
+from s3_uploader.utils.logger import LoggerManager
 
 
 def main():
@@ -16,6 +17,10 @@ def main():
     except Exception as e:
         print(f"Error: {e}")
         exit(1)
+        
+    finally:
+        # 終了前にキューに残ったログを書き出す
+        LoggerManager.shutdown()
 
 
 if __name__ == "__main__":
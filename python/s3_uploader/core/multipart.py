@@ -0,0 +1,385 @@
+"""大容量ファイルのパート並列アップロード"""
+import io
+import logging
+import math
+import mmap
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+from ..utils.file_utils import fadvise
+from .transfer import BufferPool
+
+# 出力先はLoggerManager.setupで設定される
+logger = logging.getLogger("s3_uploader")
+
+
+class _PartBody(io.RawIOBase):
+    """memoryviewの範囲をファイルライクに読み出すリクエストボディ
+    
+    botocoreはmemoryviewをBodyとして受け付けないため、読み出し可能・シーク可能な
+    ファイルオブジェクトとして包む。データはsocketへ送る分だけ読み出される。
+    """
+    
+    def __init__(self, view: memoryview):
+        super().__init__()
+        self._view = view
+        self._position = 0
+        
+    def readable(self) -> bool:
+        return True
+        
+    def seekable(self) -> bool:
+        return True
+        
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), len(self._view) - self._position)
+        if size <= 0:
+            return 0
+        buffer[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+        
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self._position = max(0, position)
+        return self._position
+        
+    def tell(self) -> int:
+        return self._position
+
+
+class _MappedFile:
+    """ファイル全体をメモリマップし、パートごとのビューを切り出す
+    
+    パートごとにopen/seek/readしてbytesへコピーする代わりに、
+    ページキャッシュ上のデータを直接送信する。
+    """
+    
+    def __init__(self, file_path: str):
+        self._file = open(file_path, "rb")
+        self._mmap: Optional[mmap.mmap] = None
+        self._view = memoryview(b"")
+        try:
+            if os.fstat(self._file.fileno()).st_size > 0:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    # 先読みを促し、読み終えたページを早めに解放させる
+                    self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+                self._view = memoryview(self._mmap)
+        except Exception:
+            self.close()
+            raise
+            
+    def part(self, offset: int, length: int) -> memoryview:
+        """指定範囲のビューを取得"""
+        return self._view[offset:offset + length]
+        
+    def close(self):
+        """ビュー・メモリマップ・ファイルを閉じる"""
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if hasattr(os, "POSIX_FADV_DONTNEED"):
+            # 送信し終えたページをページキャッシュから落とす
+            fadvise(self._file.fileno(), os.POSIX_FADV_DONTNEED)
+        self._file.close()
+
+
+class _PartReader:
+    """メモリマップできないファイルのパートを、呼び出し側のバッファへ読み込む
+    
+    POSIXではファイルを1度だけ開き、スレッドセーフなos.preadvでオフセットを指定して読む。
+    os.preadvがない環境（Windows）ではスレッドごとにファイルオブジェクトを開いてseekする。
+    ページキャッシュからの解放は、全パートを読み終えて閉じる際に1度だけ行う。
+    """
+    
+    def __init__(self, file_path: str):
+        self._file_path = file_path
+        self._fd: Optional[int] = None
+        self._local = threading.local()
+        self._files: List[BinaryIO] = []
+        self._lock = threading.Lock()
+        if hasattr(os, "preadv"):
+            self._fd = os.open(file_path, os.O_RDONLY)
+            if hasattr(os, "POSIX_FADV_SEQUENTIAL"):
+                fadvise(self._fd, os.POSIX_FADV_SEQUENTIAL)
+            
+    def readinto(self, offset: int, view: memoryview) -> int:
+        """offsetからviewの長さ分を読み込み、読み込んだバイト数を返す（EOFで打ち切り）"""
+        read = 0
+        while read < len(view):
+            with view[read:] as rest:
+                if self._fd is not None:
+                    size = os.preadv(self._fd, [rest], offset + read)
+                else:
+                    file = self._thread_file()
+                    file.seek(offset + read)
+                    size = file.readinto(rest)
+            if not size:
+                break
+            read += size
+        return read
+        
+    def _thread_file(self) -> BinaryIO:
+        """このスレッド用に開いたファイルを取得"""
+        file = getattr(self._local, "file", None)
+        if file is None:
+            file = open(self._file_path, "rb", buffering=0)
+            self._local.file = file
+            with self._lock:
+                self._files.append(file)
+        return file
+        
+    def close(self):
+        """開いているファイルを閉じる"""
+        if self._fd is not None:
+            if hasattr(os, "POSIX_FADV_DONTNEED"):
+                # 送信し終えたページをページキャッシュから落とす
+                fadvise(self._fd, os.POSIX_FADV_DONTNEED)
+            os.close(self._fd)
+            self._fd = None
+        with self._lock:
+            for file in self._files:
+                file.close()
+            self._files.clear()
+
+
+class MultipartUploader:
+    """create_multipart_uploadを直接使い、パートを並列にアップロード
+    
+    少数の巨大ファイルが大半を占める場合でも、パート数だけ並列ストリームを張れる。
+    """
+    
+    # S3の制約: パートは最小5MiB、最大10000個
+    MIN_PART_SIZE = 5 * 1024 * 1024
+    MAX_PARTS = 10000
+    
+    def __init__(self, s3_client, part_size: int, max_workers: int,
+                 buffer_count: Optional[int] = None, max_pending_parts: Optional[int] = None):
+        self.s3_client = s3_client
+        self.part_size = max(part_size, self.MIN_PART_SIZE)
+        self.max_workers = max_workers
+        # メモリマップできないファイル用の読み込みバッファ（同時に送信するパート数分）
+        self.buffer_pool = BufferPool(buffer_count or max_workers, self.part_size)
+        # ストリームで送信待ち・送信中としてメモリ上に保持するパート数の上限
+        self.max_pending_parts = max_pending_parts or max_workers * 2
+        self.logger = logger
+        
+    def upload(self, file_path: str, bucket: str, s3_key: str,
+               callback: Optional[Callable[[int], None]] = None):
+        """ファイルをマルチパートでアップロード（失敗時はアップロードを中止して例外を送出）"""
+        file_size = os.path.getsize(file_path)
+        part_size = max(self.part_size, math.ceil(file_size / self.MAX_PARTS))
+        part_count = max(1, math.ceil(file_size / part_size))
+        
+        reader: Optional[_PartReader] = None
+        try:
+            mapped_file: Optional[_MappedFile] = _MappedFile(file_path)
+        except (OSError, ValueError) as e:
+            # mmapに対応していないファイルはプールのバッファへ読み込んで送る
+            self.logger.debug("Cannot memory-map %s, using buffer pool: %s", file_path, e)
+            mapped_file = None
+            reader = _PartReader(file_path)
+            
+        try:
+            response = self.s3_client.create_multipart_upload(Bucket=bucket, Key=s3_key)
+            upload_id = response['UploadId']
+            self.logger.debug(
+                "Started multipart upload of %s (%d parts): %s", file_path, part_count, upload_id
+            )
+            
+            try:
+                pool = ThreadPoolExecutor(max_workers=self.max_workers)
+                try:
+                    futures = [
+                        pool.submit(
+                            self._upload_part, mapped_file, reader, bucket, s3_key, upload_id,
+                            part_number, (part_number - 1) * part_size, part_size, callback
+                        )
+                        for part_number in range(1, part_count + 1)
+                    ]
+                    # 完了順に確認し、最初に失敗したパートで例外を送出する
+                    for future in as_completed(futures):
+                        future.result()
+                finally:
+                    # 失敗時は未送信のパートを取り消し、送信中のパートを待ってから中止する
+                    pool.shutdown(cancel_futures=True)
+                parts = [future.result() for future in futures]
+                    
+                self.s3_client.complete_multipart_upload(
+                    Bucket=bucket,
+                    Key=s3_key,
+                    UploadId=upload_id,
+                    MultipartUpload={'Parts': parts}
+                )
+            except Exception:
+                try:
+                    self.s3_client.abort_multipart_upload(
+                        Bucket=bucket, Key=s3_key, UploadId=upload_id
+                    )
+                except Exception as e:
+                    self.logger.warning("Failed to abort multipart upload %s: %s", upload_id, e)
+                raise
+        finally:
+            if mapped_file is not None:
+                mapped_file.close()
+            if reader is not None:
+                reader.close()
+            
+    def open_stream(self, bucket: str, s3_key: str) -> 'MultipartStreamWriter':
+        """書き込んだデータをそのままマルチパートでアップロードするストリームを開く"""
+        response = self.s3_client.create_multipart_upload(Bucket=bucket, Key=s3_key)
+        upload_id = response['UploadId']
+        self.logger.debug("Started multipart stream to %s/%s: %s", bucket, s3_key, upload_id)
+        return MultipartStreamWriter(
+            self.s3_client, bucket, s3_key, upload_id, self.part_size, self.max_workers,
+            self.max_pending_parts
+        )
+        
+    def _upload_part(self, mapped_file: Optional[_MappedFile], reader: Optional[_PartReader],
+                     bucket: str, s3_key: str, upload_id: str,
+                     part_number: int, offset: int, length: int,
+                     callback: Optional[Callable[[int], None]]) -> Dict:
+        """1パート分をアップロード"""
+        if mapped_file is not None:
+            # メモリマップから切り出して送信
+            with mapped_file.part(offset, length) as view:
+                etag = self._send_part(bucket, s3_key, upload_id, part_number, view)
+                sent = len(view)
+        else:
+            # プールのバッファへ読み込んで送信
+            buffer = self.buffer_pool.acquire() if length <= self.buffer_pool.size else bytearray(length)
+            try:
+                with memoryview(buffer) as view, view[:length] as part_buffer:
+                    sent = reader.readinto(offset, part_buffer)
+                    with view[:sent] as part_view:
+                        etag = self._send_part(bucket, s3_key, upload_id, part_number, part_view)
+            finally:
+                if len(buffer) == self.buffer_pool.size:
+                    self.buffer_pool.release(buffer)
+                    
+        if callback:
+            callback(sent)
+        return {'PartNumber': part_number, 'ETag': etag}
+        
+    def _send_part(self, bucket: str, s3_key: str, upload_id: str,
+                   part_number: int, view: memoryview) -> str:
+        """パートデータを送信してETagを返す"""
+        response = self.s3_client.upload_part(
+            Bucket=bucket,
+            Key=s3_key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=_PartBody(view)
+        )
+        return response['ETag']
+
+
+class MultipartStreamWriter:
+    """書き込まれたデータをパートサイズごとに区切ってアップロードするストリーム
+    
+    サイズが事前に分からないデータ（tarアーカイブなど）をディスクに書き出さずに送る。
+    送信中のパートは max_pending_parts 個（デフォルトは max_workers * 2）までに制限し、
+    それを超えると write() が待つ。
+    """
+    
+    # パート数が上限(10000)を超えないよう、この数ごとにパートサイズを倍にする
+    PART_SIZE_GROWTH_INTERVAL = 1000
+    
+    def __init__(self, s3_client, bucket: str, s3_key: str, upload_id: str,
+                 part_size: int, max_workers: int, max_pending_parts: Optional[int] = None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.s3_key = s3_key
+        self.upload_id = upload_id
+        self.part_size = part_size
+        self.logger = logger
+        # write()で受け取った合計バイト数
+        self.size = 0
+        self._buffer = bytearray()
+        self._futures: List[Future] = []
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending_parts or max_workers * 2)
+        # 最初に失敗したパートの例外（以降のパートは送信しない）
+        self._error: Optional[BaseException] = None
+        
+    def write(self, data) -> int:
+        """データを書き込み、パートサイズに達した分をアップロード"""
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.part_size:
+            chunk = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._submit(chunk)
+        return len(data)
+        
+    def complete(self):
+        """残りのデータを送信してアップロードを完了"""
+        if self._buffer or not self._futures:
+            self._submit(bytes(self._buffer))
+            self._buffer = bytearray()
+        try:
+            for future in as_completed(self._futures):
+                future.result()
+        finally:
+            # 失敗したパートがあれば、未送信のパートは送らずに終了する
+            self._pool.shutdown(cancel_futures=True)
+        parts = [future.result() for future in self._futures]
+            
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.s3_key,
+            UploadId=self.upload_id,
+            MultipartUpload={'Parts': parts}
+        )
+        
+    def abort(self):
+        """アップロードを中止（失敗してもログ出力のみ）"""
+        self._pool.shutdown(cancel_futures=True)
+        try:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.s3_key, UploadId=self.upload_id
+            )
+        except Exception as e:
+            self.logger.warning("Failed to abort multipart upload %s: %s", self.upload_id, e)
+            
+    def _submit(self, chunk: bytes):
+        """1パート分をワーカーへ渡す（既に失敗したパートがあればその例外を送出）"""
+        self._slots.acquire()
+        if self._error is not None:
+            self._slots.release()
+            raise self._error
+        part_number = len(self._futures) + 1
+        future = self._pool.submit(self._upload_part, part_number, chunk)
+        future.add_done_callback(self._part_done)
+        self._futures.append(future)
+        
+        if part_number % self.PART_SIZE_GROWTH_INTERVAL == 0:
+            self.part_size *= 2
+            
+    def _part_done(self, future: Future):
+        """パートの完了時に失敗を記録してから送信枠を返す"""
+        if self._error is None and not future.cancelled() and future.exception() is not None:
+            self._error = future.exception()
+        self._slots.release()
+        
+    def _upload_part(self, part_number: int, chunk: bytes) -> Dict:
+        """1パートをアップロード"""
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.s3_key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=chunk
+        )
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
@@ -1,38 +1,155 @@
 """S3クライアント管理"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+
 import boto3
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
+from botocore.config import Config as BotocoreConfig
+from botocore.credentials import RefreshableCredentials
+from botocore.session import get_session as get_botocore_session
 from botocore.exceptions import NoCredentialsError, ClientError
-from ..models.config import AWSConfig
-from ..utils.logger import LoggerManager
+from ..models.config import AWSConfig, UploadOptions
+
+# 出力先はLoggerManager.setupで設定される
+logger = logging.getLogger("s3_uploader")
+
+
+# AssumeRoleで取得した一時認証情報のキャッシュファイル
+CREDENTIALS_CACHE_PATH = os.path.expanduser("~/.cache/s3uploader/creds.json")
+# 認証情報を更新する残り時間の上限（botocoreのデフォルト: 15分で更新を試み、10分で必ず更新）
+# 有効期間が短いロールでは、有効期間のそれぞれ1/4・1/8に縮める
+MAX_ADVISORY_REFRESH = timedelta(minutes=15)
+MAX_MANDATORY_REFRESH = timedelta(minutes=10)
+
+# 作成済みS3クライアントのキャッシュ（同じ設定なら接続プールとTLSセッションを再利用する）
+# （dictのget・setdefaultはスレッドセーフなのでロックは取らない）
+_client_cache: Dict[Tuple, boto3.client] = {}
+
+# バケット名 -> リージョン（取得できなかった場合はNone）
+_bucket_region_cache: Dict[str, Optional[str]] = {}
+_bucket_region_cache_lock = threading.Lock()
 
 
 class S3ClientManager:
     """S3クライアントの作成と管理"""
     
-    def __init__(self, aws_config: AWSConfig):
+    # botocoreのデフォルト(10)では並列アップロード時に接続プールが枯渇する
+    MIN_POOL_CONNECTIONS = 32
+    
+    def __init__(self, aws_config: AWSConfig, options: Optional[UploadOptions] = None):
         self.aws_config = aws_config
-        self.logger = LoggerManager.get_logger()
+        self.options = options or UploadOptions()
+        self.logger = logger
         self._client: Optional[boto3.client] = None
 
     def get_client(self) -> boto3.client:
-        """S3クライアントを取得（必要に応じて作成）"""
+        """S3クライアントを取得（必要に応じて作成）
+        
+        同じ設定のクライアントが既に作成されていれば、それを再利用する。
+        作成（AssumeRoleではSTSへの通信を伴う）はロックを取らずに行い、他の設定の
+        クライアント作成を待たせない。同時に作成された場合は先に登録された方を使う。
+        """
         if self._client is None:
-            self._client = self._create_client()
+            cache_key = self._client_cache_key()
+            client = _client_cache.get(cache_key)
+            if client is None:
+                client = _client_cache.setdefault(cache_key, self._create_client())
+            self._client = client
         return self._client
         
+    def get_bucket_region(self, bucket: str) -> Optional[str]:
+        """バケットのリージョンを取得（バケットごとに1度だけHeadBucketを発行）"""
+        with _bucket_region_cache_lock:
+            if bucket in _bucket_region_cache:
+                return _bucket_region_cache[bucket]
+                
+        try:
+            response = self.get_client().head_bucket(Bucket=bucket)
+        except ClientError as e:
+            # 別リージョンへのリダイレクトや権限エラーでもリージョンのヘッダーは返る
+            response = e.response
+        except Exception as e:
+            self.logger.warning("Failed to resolve region of bucket %s: %s", bucket, e)
+            response = {}
+            
+        headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+        region = headers.get('x-amz-bucket-region')
+        with _bucket_region_cache_lock:
+            _bucket_region_cache[bucket] = region
+        return region
+        
+    def get_client_for_bucket(self, bucket: str) -> boto3.client:
+        """バケットのリージョンに接続するS3クライアントを取得
+        
+        設定と異なるリージョンのバケットに対して、リクエストごとのリダイレクトを避ける。
+        """
+        region = self.get_bucket_region(bucket)
+        if not region or region == self.aws_config.region:
+            return self.get_client()
+        self.logger.info("Bucket %s is in region %s, using a regional client", bucket, region)
+        return S3ClientManager(replace(self.aws_config, region=region), self.options).get_client()
+        
+    def _client_cache_key(self) -> Tuple:
+        """クライアントの作成に影響する設定からキャッシュキーを作成"""
+        assume_role = self.aws_config.assume_role
+        return (
+            self.aws_config.region,
+            self.aws_config.profile,
+            assume_role.role_arn if assume_role else None,
+            assume_role.session_name if assume_role else None,
+            assume_role.external_id if assume_role else None,
+            assume_role.duration_seconds if assume_role else None,
+            self._pool_connections(),
+            self.options.max_retries,
+        )
+        
+    def _pool_connections(self) -> int:
+        """接続プールのサイズ"""
+        if self.aws_config.max_pool_connections:
+            return self.aws_config.max_pool_connections
+        # タスク並列数 × ファイル並列数 × パート並列数の同時接続を賄えるプールサイズにする
+        concurrency = (
+            self.options.parallel_tasks
+            * self.options.parallel_uploads
+            * self.options.max_concurrency
+        )
+        return max(self.MIN_POOL_CONNECTIONS, concurrency * 2)
+        
+    def _create_botocore_config(self) -> BotocoreConfig:
+        """接続プールとリトライを設定したbotocoreのConfigを作成"""
+        return BotocoreConfig(
+            max_pool_connections=self._pool_connections(),
+            retries={
+                'total_max_attempts': self.options.max_retries + 1,
+                'mode': 'adaptive'
+            },
+            tcp_keepalive=True,
+            # グローバルエンドポイント経由のリダイレクトを避ける
+            s3={'addressing_style': 'virtual', 'us_east_1_regional_endpoint': 'regional'}
+        )
+        
     def _create_client(self) -> boto3.client:
         """S3クライアントを作成"""
+        botocore_config = self._create_botocore_config()
         try:
             if self.aws_config.assume_role:
                 # AssumeRoleを使用
                 temp_credentials = self._assume_role()
                 if temp_credentials:
-                    s3_client = boto3.client(
+                    botocore_session = get_botocore_session()
+                    botocore_session._credentials = self._create_refreshable_credentials(
+                        temp_credentials
+                    )
+                    s3_client = boto3.Session(botocore_session=botocore_session).client(
                         's3',
                         region_name=self.aws_config.region,
-                        aws_access_key_id=temp_credentials['access_key_id'],
-                        aws_secret_access_key=temp_credentials['secret_access_key'],
-                        aws_session_token=temp_credentials['session_token']
+                        config=botocore_config
                     )
                     self.logger.info("S3 client created with assumed role credentials.")
                     return s3_client
@@ -40,9 +157,17 @@ class S3ClientManager:
             # 通常の認証
             if self.aws_config.profile:
                 session = boto3.Session(profile_name=self.aws_config.profile)
-                s3_client = session.client('s3', region_name=self.aws_config.region)
+                s3_client = session.client(
+                    's3',
+                    region_name=self.aws_config.region,
+                    config=botocore_config
+                )
             else:
-                s3_client = boto3.client('s3', region_name=self.aws_config.region)
+                s3_client = boto3.client(
+                    's3',
+                    region_name=self.aws_config.region,
+                    config=botocore_config
+                )
                 
             self.logger.info("S3 client created with default credentials.")
             return s3_client
@@ -51,12 +176,62 @@ class S3ClientManager:
             self.logger.error("AWS credentials not available.")
             raise
         except Exception as e:
-            self.logger.error(f"Error creating S3 client: {e}")
+            self.logger.error("Error creating S3 client: %s", e)
             raise
             
-    def _assume_role(self) -> Optional[Dict[str, str]]:
+    def _refresh_windows(self) -> Tuple[timedelta, timedelta]:
+        """認証情報の更新を試みる・必ず更新する残り時間を返す
+        
+        botocoreのデフォルト（15分・10分）のままでは、900秒のロールは取得直後から
+        更新対象となり、署名のたびにAssumeRoleが発行されてしまう。
+        """
+        duration = timedelta(seconds=self.aws_config.assume_role.duration_seconds)
+        return min(duration / 4, MAX_ADVISORY_REFRESH), min(duration / 8, MAX_MANDATORY_REFRESH)
+        
+    def _create_refreshable_credentials(self, temp_credentials: Dict[str, str]) -> RefreshableCredentials:
+        """期限が近づくとクライアント内で更新される認証情報を作成
+        
+        クライアントを作り直さないため、接続プールは維持される。
+        """
+        advisory, mandatory = self._refresh_windows()
+        return RefreshableCredentials.create_from_metadata(
+            metadata=self._credentials_metadata(temp_credentials),
+            refresh_using=self._refresh_credentials,
+            method='sts-assume-role',
+            advisory_timeout=int(advisory.total_seconds()),
+            mandatory_timeout=int(mandatory.total_seconds())
+        )
+        
+    def _refresh_credentials(self) -> Dict[str, str]:
+        """RefreshableCredentialsから呼ばれる更新処理"""
+        # 期限の近いキャッシュを掴まないよう、常にAssumeRoleし直す
+        temp_credentials = self._assume_role(use_cache=False)
+        if not temp_credentials:
+            raise RuntimeError(
+                f"Failed to refresh credentials for role: {self.aws_config.assume_role.role_arn}"
+            )
+        self.logger.info("Refreshed assumed role credentials.")
+        return self._credentials_metadata(temp_credentials)
+        
+    @staticmethod
+    def _credentials_metadata(temp_credentials: Dict[str, str]) -> Dict[str, str]:
+        """一時認証情報をbotocoreのメタデータ形式に変換"""
+        return {
+            'access_key': temp_credentials['access_key_id'],
+            'secret_key': temp_credentials['secret_access_key'],
+            'token': temp_credentials['session_token'],
+            'expiry_time': temp_credentials['expiration'],
+        }
+        
+    def _assume_role(self, use_cache: bool = True) -> Optional[Dict[str, str]]:
         """AssumeRoleを実行して一時的な認証情報を取得"""
         assume_role_config = self.aws_config.assume_role
+        cache_key = self._credentials_cache_key()
+        
+        cached = self._load_cached_credentials(cache_key) if use_cache else None
+        if cached:
+            self.logger.info("Using cached credentials for role: %s", assume_role_config.role_arn)
+            return cached
         
         try:
             # STSクライアントを作成
@@ -89,17 +264,80 @@ class S3ClientManager:
             response = sts_client.assume_role(**assume_role_params)
             credentials = response['Credentials']
             
-            self.logger.info(f"Assumed role successfully: {assume_role_config.role_arn}")
+            self.logger.info("Assumed role successfully: %s", assume_role_config.role_arn)
             
-            return {
+            temp_credentials = {
                 'access_key_id': credentials['AccessKeyId'],
                 'secret_access_key': credentials['SecretAccessKey'],
-                'session_token': credentials['SessionToken']
+                'session_token': credentials['SessionToken'],
+                'expiration': credentials['Expiration'].isoformat()
             }
+            self._save_cached_credentials(cache_key, temp_credentials)
+            return temp_credentials
             
         except ClientError as e:
-            self.logger.error(f"Error assuming role: {e}")
+            self.logger.error("Error assuming role: %s", e)
             return None
         except Exception as e:
-            self.logger.error(f"Unexpected error during assume role: {e}")
+            self.logger.error("Unexpected error during assume role: %s", e)
+            return None
+            
+    def _credentials_cache_key(self) -> str:
+        """ロール・セッション・外部IDからキャッシュキーを作成"""
+        assume_role_config = self.aws_config.assume_role
+        source = "|".join([
+            assume_role_config.role_arn,
+            assume_role_config.session_name,
+            assume_role_config.external_id or "",
+            self.aws_config.profile or "",
+        ])
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+        
+    def _load_cached_credentials(self, cache_key: str) -> Optional[Dict[str, str]]:
+        """有効期限内のキャッシュ済み認証情報を取得"""
+        try:
+            with open(CREDENTIALS_CACHE_PATH, "r", encoding="utf-8") as file:
+                entry = json.load(file).get(cache_key)
+        except (OSError, ValueError):
             return None
+            
+        if not entry:
+            return None
+            
+        try:
+            expiration = datetime.fromisoformat(entry['expiration'])
+        except (KeyError, ValueError):
+            return None
+            
+        # botocoreがすぐに更新する残り時間であればキャッシュを使わない
+        advisory, _ = self._refresh_windows()
+        if datetime.now(timezone.utc) >= expiration - advisory:
+            return None
+        return entry
+        
+    def _save_cached_credentials(self, cache_key: str, credentials: Dict[str, str]):
+        """認証情報をキャッシュファイルに保存（パーミッション0600）"""
+        try:
+            try:
+                with open(CREDENTIALS_CACHE_PATH, "r", encoding="utf-8") as file:
+                    entries = json.load(file)
+            except (OSError, ValueError):
+                entries = {}
+                
+            entries[cache_key] = credentials
+            
+            cache_dir = os.path.dirname(CREDENTIALS_CACHE_PATH)
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+            # 一時ファイル（mkstempは0600で作成する）に書き込んでから置き換え、
+            # 既存ファイルのパーミッションが緩くても認証情報をそこへ書き込まない
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=".creds-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as file:
+                    json.dump(entries, file)
+                os.replace(tmp_path, CREDENTIALS_CACHE_PATH)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            # キャッシュの保存に失敗してもアップロード自体は継続する
+            self.logger.warning("Failed to cache assumed role credentials: %s", e)
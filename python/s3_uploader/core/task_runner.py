@@ -1,12 +1,25 @@
 """アップロードタスクの実行"""
+import logging
 import os
-from typing import Tuple
+import stat
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import Dict, Iterator, Optional, Tuple
 
 from ..models.config import UploadTask, Config
-from ..utils.logger import LoggerManager
-from ..utils.file_utils import FileScanner
+from ..utils.file_utils import (
+    FileScanner, FileInfo, make_s3_key, normalize_key_prefix, open_sequential
+)
+from ..utils.json_utils import json_dumps
+from ..utils.transfer_log import TransferLogger
 from .uploader import UploadExecutor, ParallelUploadExecutor
 from .s3_client import S3ClientManager
+from .transfer import TransferConfigManager
+
+# 出力先はLoggerManager.setupで設定される
+logger = logging.getLogger("s3_uploader")
 
 
 class TaskRunner:
@@ -14,99 +27,265 @@ class TaskRunner:
     
     def __init__(self, config: Config):
         self.config = config
-        self.logger = LoggerManager.get_logger()
+        self.logger = logger
         
         # S3クライアントとアップローダーを初期化
-        client_manager = S3ClientManager(config.aws)
-        self.s3_client = client_manager.get_client()
-        self.executor = UploadExecutor(self.s3_client, config.options)
-        self.parallel_executor = ParallelUploadExecutor(
-            self.executor, 
-            config.options.parallel_uploads
-        )
+        self.client_manager = S3ClientManager(config.aws, config.options)
+        self.s3_client = self.client_manager.get_client()
+        
+        # ドライランではバケットに計測用オブジェクトを書き込まない
+        if config.options.auto_tune and not config.options.dry_run:
+            config = self._auto_tune(config)
+            self.config = config
+            # 接続プールを調整後の並列数に合わせて作り直す
+            self.client_manager = S3ClientManager(config.aws, config.options)
+            self.s3_client = self.client_manager.get_client()
+            
+        # アップローダーと転送ログは実行ごとに作成し、実行の終わりに閉じる
+        self.transfer_logger: Optional[TransferLogger] = None
+        # リージョン -> (UploadExecutor, ParallelUploadExecutor)
+        self._regional_executors: Dict[str, Tuple[UploadExecutor, ParallelUploadExecutor]] = {}
+        self._regional_executors_lock = threading.Lock()
         self.file_scanner = FileScanner(config.options.exclude_patterns)
         
+    def _create_executors(self, s3_client) -> Tuple[UploadExecutor, ParallelUploadExecutor]:
+        """クライアントに対応するアップローダーを作成"""
+        executor = UploadExecutor(s3_client, self.config.options, self.transfer_logger)
+        parallel_executor = ParallelUploadExecutor(executor, self.config.options.parallel_uploads)
+        return executor, parallel_executor
+        
+    def _executors_for(self, bucket: str) -> Tuple[UploadExecutor, ParallelUploadExecutor]:
+        """バケットのリージョンに接続するアップローダーを取得（リージョンごとに1度だけ作成）"""
+        s3_client = self.client_manager.get_client_for_bucket(bucket)
+        region = s3_client.meta.region_name
+        with self._regional_executors_lock:
+            executors = self._regional_executors.get(region)
+            if executors is None:
+                executors = self._create_executors(s3_client)
+                self._regional_executors[region] = executors
+        return executors
+        
+    def _auto_tune(self, config: Config) -> Config:
+        """最初の有効なタスクのバケットで回線を計測して設定を調整"""
+        buckets = [task.bucket for task in config.upload_tasks if task.enabled]
+        if not buckets:
+            return config
+        # 別リージョンのバケットでは、リダイレクトの往復をRTTに含めないようリージョンのクライアントで計測する
+        s3_client = self.client_manager.get_client_for_bucket(buckets[0])
+        options = TransferConfigManager.auto_tune(s3_client, buckets[0], config.options)
+        # キャッシュされたConfigを書き換えないようにコピーを作る
+        return replace(config, options=options)
+        
     def run_all_tasks(self) -> Tuple[int, int]:
         """全てのタスクを実行"""
         total_tasks = len(self.config.upload_tasks)
-        successful_tasks = 0
-        failed_tasks = 0
         
-        self.logger.info(f"Starting upload tasks: {total_tasks} tasks to process")
+        self.logger.info("Starting upload tasks: %d tasks to process", total_tasks)
         
-        for i, task in enumerate(self.config.upload_tasks, 1):
-            if not task.enabled:
-                self.logger.info(f"Skipping disabled task: {task.name}")
-                continue
-                
-            self.logger.info(f"Task {i}/{total_tasks}: Starting '{task.name}'")
-            
-            try:
-                success = self._run_single_task(task)
-                if success:
-                    successful_tasks += 1
-                    self.logger.info(f"Task {i}/{total_tasks}: '{task.name}' completed successfully")
-                else:
-                    failed_tasks += 1
-                    self.logger.error(f"Task {i}/{total_tasks}: '{task.name}' failed")
-            except Exception as e:
-                failed_tasks += 1
-                self.logger.error(f"Task {i}/{total_tasks}: '{task.name}' failed with error: {e}")
-                
+        if self.config.logging.transfer_log:
+            self.transfer_logger = TransferLogger(self.config.logging.transfer_log)
+        try:
+            successful_tasks, failed_tasks = self._run_enabled_tasks(total_tasks)
+        finally:
+            self._close_executors()
+            
         self.logger.info(
-            f"Upload tasks completed: {successful_tasks} successful, {failed_tasks} failed"
+            "Upload tasks completed: %d successful, %d failed", successful_tasks, failed_tasks
         )
         return successful_tasks, failed_tasks
         
+    def _run_enabled_tasks(self, total_tasks: int) -> Tuple[int, int]:
+        """有効なタスクを実行して (成功数, 失敗数) を返す"""
+        enabled_tasks = []
+        for i, task in enumerate(self.config.upload_tasks, 1):
+            if not task.enabled:
+                self.logger.info("Skipping disabled task: %s", task.name)
+                continue
+            enabled_tasks.append((i, task))
+            
+        if self.config.options.parallel_tasks > 1:
+            # タスク間は独立しているため、スキャンとアップロードをタスク単位でも並行させる
+            with ThreadPoolExecutor(max_workers=self.config.options.parallel_tasks) as pool:
+                results = list(pool.map(
+                    lambda item: self._run_numbered_task(item[0], total_tasks, item[1]),
+                    enabled_tasks
+                ))
+        else:
+            results = [self._run_numbered_task(i, total_tasks, task) for i, task in enabled_tasks]
+            
+        return results.count(True), results.count(False)
+        
+    def _close_executors(self):
+        """この実行で作成したアップローダーと転送ログを閉じる"""
+        with self._regional_executors_lock:
+            executors = list(self._regional_executors.values())
+            self._regional_executors.clear()
+        for executor, parallel_executor in executors:
+            parallel_executor.close()
+            executor.close()
+        if self.transfer_logger is not None:
+            self.transfer_logger.close()
+            self.transfer_logger = None
+            
+    def _run_numbered_task(self, i: int, total_tasks: int, task: UploadTask) -> bool:
+        """タスクを実行して結果をログに出力"""
+        self.logger.info("Task %d/%d: Starting '%s'", i, total_tasks, task.name)
+        
+        try:
+            success = self._run_single_task(task)
+        except Exception as e:
+            self.logger.error(
+                "Task %d/%d: '%s' failed with error: %s", i, total_tasks, task.name, e
+            )
+            return False
+            
+        if success:
+            self.logger.info("Task %d/%d: '%s' completed successfully", i, total_tasks, task.name)
+        else:
+            self.logger.error("Task %d/%d: '%s' failed", i, total_tasks, task.name)
+        return success
+        
     def _run_single_task(self, task: UploadTask) -> bool:
         """単一タスクを実行"""
-        if os.path.isfile(task.source):
+        # statは1回だけ行い、種別とサイズはその結果から判定する
+        try:
+            source_stat = os.stat(task.source)
+        except OSError:
+            source_stat = None
+            
+        if source_stat is not None and stat.S_ISREG(source_stat.st_mode):
             # 単一ファイルのアップロード
-            return self._upload_single_file(task)
-        elif os.path.isdir(task.source):
+            return self._upload_single_file(task, source_stat)
+        elif source_stat is not None and stat.S_ISDIR(source_stat.st_mode):
             # ディレクトリのアップロード
+            if task.aggregate:
+                return self._upload_directory_aggregated(task)
             return self._upload_directory(task)
         else:
-            self.logger.error(f"Source is neither file nor directory: {task.source}")
+            self.logger.error("Source is neither file nor directory: %s", task.source)
             return False
             
-    def _upload_single_file(self, task: UploadTask) -> bool:
+    def _upload_single_file(self, task: UploadTask, source_stat: os.stat_result) -> bool:
         """単一ファイルをアップロード"""
         if not task.s3_key:
-            self.logger.error(f"s3_key is required for file upload: {task.name}")
+            self.logger.error("s3_key is required for file upload: %s", task.name)
             return False
             
         try:
-            file_info = self.file_scanner.get_file_info(task.source)
-            result = self.executor.upload_file(file_info, task.bucket, task.s3_key)
+            file_info = self.file_scanner.get_file_info(task.source, source_stat)
+            executor, _ = self._executors_for(task.bucket)
+            result = executor.upload_file(file_info, task.bucket, task.s3_key)
             return result.success
         except Exception as e:
-            self.logger.error(f"Error uploading file {task.source}: {e}")
+            self.logger.error("Error uploading file %s: %s", task.source, e)
             return False
             
     def _upload_directory(self, task: UploadTask) -> bool:
         """ディレクトリをアップロード"""
-        s3_key_prefix = task.s3_key_prefix or ""
-        
         try:
-            # アップロードタスクを収集
-            upload_tasks = []
-            for file_info in self.file_scanner.scan_directory(task.source, task.recursive):
-                s3_key = s3_key_prefix + file_info.relative_path.replace(os.sep, "/")
-                upload_tasks.append((file_info, task.bucket, s3_key))
-                
-            if not upload_tasks:
-                self.logger.warning(f"No files found in {task.source}")
+            # スキャン結果を逐次ワーカーへ流しながら並列アップロード実行
+            _, parallel_executor = self._executors_for(task.bucket)
+            successful, failed = parallel_executor.upload_files(
+                self._iter_upload_items(task)
+            )
+            
+            if successful == 0 and failed == 0:
+                self.logger.warning("No files found in %s", task.source)
                 return True
                 
-            # 並列アップロード実行
-            successful, failed = self.parallel_executor.upload_files(upload_tasks)
-            
             self.logger.info(
-                f"Directory upload completed: {successful} successful, {failed} failed"
+                "Directory upload completed: %d successful, %d failed", successful, failed
             )
             return failed == 0
             
         except Exception as e:
-            self.logger.error(f"Error uploading directory {task.source}: {e}")
-            return False
\ No newline at end of file
+            self.logger.error("Error uploading directory %s: %s", task.source, e)
+            return False
+            
+    def _upload_directory_aggregated(self, task: UploadTask) -> bool:
+        """ディレクトリを1つのtarアーカイブにまとめてアップロード
+        
+        小さなファイルが大量にある場合、ファイルごとのリクエストの往復時間ではなく
+        帯域で所要時間が決まるようにする。各ファイルのアーカイブ内の位置は
+        "<アーカイブのキー>.index.json" に {名前: [オフセット, サイズ]} として保存し、
+        Range指定で個別に取得できるようにする。
+        """
+        archive_key = task.s3_key or make_s3_key(
+            normalize_key_prefix(task.s3_key_prefix),
+            os.path.basename(os.path.normpath(task.source)) + ".tar"
+        )
+        index_key = archive_key + ".index.json"
+        
+        if self.config.options.dry_run:
+            planned_files = 0
+            planned_size = 0
+            for file_info in self.file_scanner.scan_directory(task.source, task.recursive):
+                planned_files += 1
+                planned_size += file_info.size
+            self.logger.info(
+                "[DRY RUN]: Would upload %d files from %s as archive %s/%s",
+                planned_files, task.source, task.bucket, archive_key
+            )
+            self._record_transfer(task.source, task.bucket, archive_key, "planned", planned_size)
+            self._record_transfer(task.source, task.bucket, index_key, "planned", 0)
+            return True
+            
+        index = {}
+        try:
+            executor, _ = self._executors_for(task.bucket)
+            writer = executor.multipart_uploader.open_stream(task.bucket, archive_key)
+        except Exception as e:
+            self.logger.error("Error starting archive upload for %s: %s", task.source, e)
+            self._record_transfer(task.source, task.bucket, archive_key, "failed", 0, str(e))
+            return False
+            
+        try:
+            # シンボリックリンクは通常のアップロードと同様にリンク先の内容を格納する
+            with tarfile.open(fileobj=writer, mode="w|", dereference=True) as tar:
+                for file_info in self.file_scanner.scan_directory(task.source, task.recursive):
+                    name = file_info.relative_path.replace(os.sep, "/")
+                    with open_sequential(file_info.path) as file:
+                        # 開いたファイルをfstatし、ヘッダーのサイズと書き込む内容を一致させる
+                        tar_info = tar.gettarinfo(arcname=name, fileobj=file)
+                        tar.addfile(tar_info, file)
+                    # addfile後のoffsetは512バイト境界に揃えたデータ末尾を指す
+                    padded_size = -(-tar_info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                    index[name] = [tar.offset - padded_size, tar_info.size]
+            writer.complete()
+        except Exception as e:
+            writer.abort()
+            self.logger.error("Error uploading archive for %s: %s", task.source, e)
+            self._record_transfer(task.source, task.bucket, archive_key, "failed", writer.size, str(e))
+            return False
+        self._record_transfer(task.source, task.bucket, archive_key, "uploaded", writer.size)
+            
+        index_body = json_dumps(index).encode("utf-8")
+        try:
+            executor.s3_client.put_object(
+                Bucket=task.bucket,
+                Key=index_key,
+                Body=index_body,
+                ContentType="application/json"
+            )
+        except Exception as e:
+            self.logger.error("Error uploading archive index %s: %s", index_key, e)
+            self._record_transfer(task.source, task.bucket, index_key, "failed", len(index_body), str(e))
+            return False
+        self._record_transfer(task.source, task.bucket, index_key, "uploaded", len(index_body))
+            
+        self.logger.info(
+            "Archive upload completed: %d files to %s/%s", len(index), task.bucket, archive_key
+        )
+        return True
+        
+    def _record_transfer(self, path: str, bucket: str, s3_key: str, status: str,
+                         size: int, error: Optional[str] = None):
+        """転送ログが設定されていれば転送結果を記録"""
+        if self.transfer_logger is not None:
+            self.transfer_logger.record(path, bucket, s3_key, status, size, error)
+            
+    def _iter_upload_items(self, task: UploadTask) -> Iterator[Tuple[FileInfo, str, str]]:
+        """ディレクトリ内のファイルを (FileInfo, bucket, s3_key) として順次生成"""
+        key_prefix = normalize_key_prefix(task.s3_key_prefix)
+        for file_info in self.file_scanner.scan_directory(task.source, task.recursive):
+            yield file_info, task.bucket, make_s3_key(key_prefix, file_info.relative_path)
@@ -1,11 +1,65 @@
 """S3転送設定管理"""
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from dataclasses import replace
+from typing import Optional, Tuple
+
 from boto3.s3.transfer import TransferConfig as BotoTransferConfig
 from ..models.config import UploadOptions
 
+# 出力先はLoggerManager.setupで設定される
+logger = logging.getLogger("s3_uploader")
+
+
+class BufferPool:
+    """固定サイズのbytearrayを使い回すバッファプール
+    
+    バッファは必要になった時点で上限数まで確保し、以降は返却されたものを再利用する。
+    ヒープ使用量は (上限数 × サイズ) に抑えられ、大きな領域の確保・解放を繰り返さない。
+    """
+    
+    def __init__(self, count: int, size: int):
+        self.size = size
+        self._free: queue.LifoQueue = queue.LifoQueue()
+        self._remaining = count
+        self._lock = threading.Lock()
+        
+    def acquire(self, timeout: Optional[float] = None) -> bytearray:
+        """バッファを取得（上限まで確保済みなら返却を待つ）"""
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._remaining > 0:
+                self._remaining -= 1
+                return bytearray(self.size)
+        return self._free.get(timeout=timeout)
+        
+    def release(self, buffer: bytearray):
+        """バッファを返却"""
+        self._free.put(buffer)
+
 
 class TransferConfigManager:
     """S3転送設定の管理"""
     
+    # 自動チューニングで使う計測用オブジェクトのサイズとキー
+    PROBE_SIZE = 4 * 1024 * 1024  # 4MB
+    PROBE_KEY_PREFIX = ".s3-uploader-probe/"
+    # 自動チューニングで設定する同時並行数の範囲
+    MIN_TUNED_CONCURRENCY = 4
+    MAX_TUNED_CONCURRENCY = 64
+    # 自動チューニングで設定するパートサイズの範囲と、帯域幅遅延積に対する倍率
+    MIN_TUNED_CHUNKSIZE = 5 * 1024 * 1024  # 5MiB（S3の最小パートサイズ）
+    MAX_TUNED_CHUNKSIZE = 100 * 1024 * 1024  # 100MiB
+    CHUNKSIZE_BDP_FACTOR = 4
+    
     @staticmethod
     def create_config(options: UploadOptions) -> BotoTransferConfig:
         """UploadOptionsからTransferConfigを作成"""
@@ -16,4 +70,80 @@ class TransferConfigManager:
             use_threads=options.use_threads,
             max_io_queue=options.max_io_queue,
             io_chunksize=options.io_chunksize,
-        )
\ No newline at end of file
+        )
+        
+    @staticmethod
+    def max_parts_in_flight(options: UploadOptions) -> int:
+        """同時に転送するパート数の上限
+        
+        ファイル並列数 × ファイルあたりの並列数とし、memory_budget_mbが設定されていれば
+        転送中のパートの合計サイズが予算に収まる数に抑える。
+        """
+        parts = max(1, options.parallel_uploads) * options.max_concurrency
+        if options.memory_budget_mb:
+            budget = options.memory_budget_mb * 1024 * 1024
+            parts = min(parts, max(1, budget // options.multipart_chunksize))
+        return parts
+        
+    @classmethod
+    def create_shared_config(cls, options: UploadOptions) -> BotoTransferConfig:
+        """全ファイルで共有するTransferManager用のTransferConfigを作成
+        
+        ファイルごとにプールを持っていた場合と同時転送パート数を揃える。
+        """
+        total_concurrency = cls.max_parts_in_flight(options)
+        return cls.create_config(replace(options, max_concurrency=total_concurrency))
+        
+    @classmethod
+    def auto_tune(cls, s3_client, bucket: str, options: UploadOptions) -> UploadOptions:
+        """回線を計測してmax_concurrencyとmultipart_chunksizeを決めたUploadOptionsを返す
+        
+        1接続あたりのスループットを計測し、目標帯域を満たすのに必要な接続数を
+        同時並行数とする。パートサイズは1接続の帯域幅遅延積の数倍とし、
+        パートごとの往復時間が転送時間に埋もれるようにする。
+        計測に失敗した場合は元の設定をそのまま返す。
+        """
+        try:
+            rtt, bandwidth = cls._measure_link(s3_client, bucket)
+        except Exception as e:
+            logger.warning("Auto-tune probe failed, keeping configured options: %s", e)
+            return options
+            
+        target_bandwidth = options.target_bandwidth_mbps * 1000 * 1000 / 8  # bytes/s
+        concurrency = math.ceil(target_bandwidth / bandwidth)
+        concurrency = min(max(concurrency, cls.MIN_TUNED_CONCURRENCY), cls.MAX_TUNED_CONCURRENCY)
+        
+        chunksize = int(bandwidth * rtt * cls.CHUNKSIZE_BDP_FACTOR)
+        chunksize = min(max(chunksize, cls.MIN_TUNED_CHUNKSIZE), cls.MAX_TUNED_CHUNKSIZE)
+        
+        logger.info(
+            "Auto-tuned max_concurrency=%d, multipart_chunksize=%d (rtt=%.0fms, per-stream=%.2f MB/s)",
+            concurrency, chunksize, rtt * 1000, bandwidth / 1024 / 1024
+        )
+        return replace(options, max_concurrency=concurrency, multipart_chunksize=chunksize)
+        
+    @classmethod
+    def _measure_link(cls, s3_client, bucket: str) -> Tuple[float, float]:
+        """RTT（秒）と1接続あたりの帯域（bytes/s）を計測"""
+        # 小さなリクエストでRTTを計測
+        start = time.monotonic()
+        s3_client.head_bucket(Bucket=bucket)
+        rtt = time.monotonic() - start
+        
+        # 計測用オブジェクトをPUTしてスループットを計測
+        key = f"{cls.PROBE_KEY_PREFIX}{uuid.uuid4().hex}"
+        body = os.urandom(cls.PROBE_SIZE)
+        try:
+            start = time.monotonic()
+            s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+            elapsed = time.monotonic() - start
+        finally:
+            # 計測に失敗しても計測用オブジェクトをバケットに残さない
+            try:
+                s3_client.delete_object(Bucket=bucket, Key=key)
+            except Exception as e:
+                logger.warning("Failed to delete auto-tune probe object %s: %s", key, e)
+        
+        # 転送時間からリクエスト往復分を差し引く
+        transfer_time = max(elapsed - rtt, 1e-3)
+        return rtt, cls.PROBE_SIZE / transfer_time
@@ -1,146 +1,435 @@
 """S3アップロード実行クラス"""
-from typing import Optional, Tuple, List
+from typing import Callable, Optional, Tuple, Iterable
 from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor
+import functools
+import hashlib
+import logging
+import mimetypes
+import queue
+import threading
 import time
 
+from boto3.s3.transfer import ProgressCallbackInvoker
 from botocore.exceptions import ClientError, NoCredentialsError
+from s3transfer.futures import NonThreadedExecutor
+from s3transfer.manager import TransferManager
+from s3transfer.subscribers import BaseSubscriber
 from ..models.config import UploadOptions
-from ..utils.logger import LoggerManager
 from ..utils.progress import ProgressManager
-from ..utils.file_utils import FileInfo
+from ..utils.file_utils import FileInfo, drop_page_cache, file_md5, open_sequential
+from ..utils.compression import compress_zstd, compression_available, is_compressible
+from ..utils.transfer_log import TransferLogger
 from .transfer import TransferConfigManager
+from .multipart import MultipartUploader
 
+# 出力先はLoggerManager.setupで設定される
+logger = logging.getLogger("s3_uploader")
 
-@dataclass
+
+@dataclass(slots=True)
 class UploadResult:
     """アップロード結果"""
     file_path: str
     success: bool
     error: Optional[str] = None
+    skipped: bool = False
     
     
 class UploadExecutor:
     """ファイルアップロードの実行"""
     
-    def __init__(self, s3_client, options: UploadOptions):
+    # これより小さいファイルは1リクエストで終わるため進捗を表示しない
+    PROGRESS_MIN_SIZE = 1024 * 1024  # 1MB
+    
+    def __init__(self, s3_client, options: UploadOptions,
+                 transfer_logger: Optional[TransferLogger] = None):
         self.s3_client = s3_client
         self.options = options
-        self.logger = LoggerManager.get_logger()
-        self.transfer_config = TransferConfigManager.create_config(options)
+        self.logger = logger
+        # 全ファイルで1つのTransferManager（スレッドプール）を共有し、
+        # 小さなファイルと大きなファイルのパートが同じプールで公平に処理されるようにする
+        self.transfer_config = TransferConfigManager.create_shared_config(options)
+        self.transfer_manager = TransferManager(
+            s3_client,
+            config=self.transfer_config,
+            executor_cls=None if options.use_threads else NonThreadedExecutor
+        )
         self.progress_manager = ProgressManager()
+        self.transfer_logger = transfer_logger
+        self.compress = options.compress and compression_available()
+        if options.compress and not self.compress:
+            self.logger.warning("zstandard is not installed, uploading without compression")
+        # 同時に転送するパート数（memory_budget_mb設定時は予算に収まる数）で、
+        # ファイルあたりの並列数・読み込みバッファ数・ストリームで保持するパート数を抑える
+        parts_in_flight = self.transfer_config.max_concurrency
+        self.multipart_uploader = MultipartUploader(
+            s3_client,
+            options.multipart_chunksize,
+            min(options.max_concurrency, parts_in_flight),
+            buffer_count=parts_in_flight,
+            max_pending_parts=parts_in_flight if options.memory_budget_mb else None
+        )
+        if options.memory_budget_mb:
+            self.logger.info(
+                "Memory budget %d MB: up to %d concurrent part requests, "
+                "%d parallel multipart workers, %d part buffers and %d pending stream parts "
+                "of %d bytes",
+                options.memory_budget_mb,
+                self.transfer_config.max_request_concurrency,
+                self.multipart_uploader.max_workers,
+                parts_in_flight,
+                self.multipart_uploader.max_pending_parts,
+                self.multipart_uploader.part_size
+            )
         
     def upload_file(self, file_info: FileInfo, bucket: str, s3_key: str) -> UploadResult:
-        """単一ファイルをアップロード"""
+        """単一ファイルをアップロード（完了まで待つ）"""
+        return self.start_upload(file_info, bucket, s3_key).result()
+        
+    def start_upload(self, file_info: FileInfo, bucket: str, s3_key: str) -> Future:
+        """アップロードを開始し、UploadResultを返すFutureを返す
+        
+        TransferManagerに渡すファイルは転送の完了を待たずに戻る。それ以外（PutObject・
+        パートの並列アップロード・変更判定）は呼び出したスレッドで実行し、完了済みのFutureを返す。
+        """
+        future: Future = Future()
+        done = functools.partial(self._complete, future, file_info, bucket, s3_key)
+        try:
+            self._upload_file(file_info, bucket, s3_key, done)
+        except Exception as e:
+            done(self._error_result(file_info, e))
+        return future
+        
+    def _complete(self, future: Future, file_info: FileInfo, bucket: str, s3_key: str,
+                  result: UploadResult):
+        """転送ログに記録してからFutureを完了させる（2回目以降の呼び出しは無視）"""
+        if future.done():
+            return
+        if self.transfer_logger is not None:
+            if self.options.dry_run:
+                status = "planned"
+            elif result.skipped:
+                status = "skipped"
+            elif result.success:
+                status = "uploaded"
+            else:
+                status = "failed"
+            self.transfer_logger.record(
+                file_info.path, bucket, s3_key, status, file_info.size, result.error
+            )
+        future.set_result(result)
+        
+    def _upload_file(self, file_info: FileInfo, bucket: str, s3_key: str,
+                     done: Callable[[UploadResult], None]):
+        """単一ファイルをアップロードし、結果をdoneに渡す"""
         if self.options.dry_run:
-            self.logger.info(f"[DRY RUN]: Would upload {file_info.path} to {bucket}/{s3_key}")
-            return UploadResult(file_info.path, success=True)
+            self.logger.info("[DRY RUN]: Would upload %s to %s/%s", file_info.path, bucket, s3_key)
+            done(UploadResult(file_info.path, success=True))
+            return
             
-        # リトライ処理
-        for attempt in range(self.options.max_retries + 1):
-            try:
-                return self._execute_upload(file_info, bucket, s3_key)
-            except Exception as e:
-                if attempt < self.options.max_retries:
-                    wait_time = 2 ** attempt  # 指数バックオフ
-                    self.logger.warning(
-                        f"Upload failed (attempt {attempt + 1}/{self.options.max_retries + 1}), "
-                        f"retrying in {wait_time}s: {file_info.path}"
-                    )
-                    time.sleep(wait_time)
-                else:
-                    self.logger.error(
-                        f"Upload failed after {self.options.max_retries + 1} attempts: {file_info.path}"
-                    )
-                    return UploadResult(file_info.path, success=False, error=str(e))
+        if self.options.skip_unchanged and self._is_unchanged(file_info, bucket, s3_key):
+            self.logger.debug("Skipping unchanged file: %s", file_info.path)
+            done(UploadResult(file_info.path, success=True, skipped=True))
+            return
+            
+        # リトライはS3クライアント側（botocoreのadaptiveモード）で行う
+        self._execute_upload(file_info, bucket, s3_key, done)
                     
-    def _execute_upload(self, file_info: FileInfo, bucket: str, s3_key: str) -> UploadResult:
+    def close(self):
+        """共有しているTransferManagerを終了"""
+        self.transfer_manager.shutdown()
+        
+    def _is_unchanged(self, file_info: FileInfo, bucket: str, s3_key: str) -> bool:
+        """S3上のオブジェクトがローカルファイルと同一かをHEADで判定"""
+        try:
+            response = self.s3_client.head_object(Bucket=bucket, Key=s3_key)
+        except ClientError:
+            return False
+            
+        metadata = response.get('Metadata', {})
+        if 'uncompressed-size' in metadata:
+            # 圧縮してアップロードしたオブジェクトは、保存しておいた元ファイルのサイズとMD5で比較する
+            if metadata['uncompressed-size'] != str(file_info.size):
+                return False
+            source_md5 = metadata.get('source-md5')
+            return source_md5 is not None and source_md5 == file_md5(file_info.path)
+            
+        if response.get('ContentLength') != file_info.size:
+            return False
+            
+        # マルチパートのETag（"-パート数"付き）はMD5ではないため比較しない
+        etag = response.get('ETag', '').strip('"')
+        if not etag or '-' in etag:
+            return False
+            
+        return etag == file_md5(file_info.path)
+        
+    def _put_object(self, file_info: FileInfo, bucket: str, s3_key: str):
+        """1回のPutObjectでアップロード（設定されていればzstdで圧縮）"""
+        with open_sequential(file_info.path) as file:
+            if not (self.compress and is_compressible(file_info.path)):
+                self.s3_client.put_object(
+                    Bucket=bucket, Key=s3_key, Body=file, ContentLength=file_info.size
+                )
+                return
+                
+            extra_args = {}
+            content_type = mimetypes.guess_type(file_info.path)[0]
+            if content_type:
+                # 圧縮後も元のContent-Typeを保つ
+                extra_args['ContentType'] = content_type
+            # ETagは圧縮後の内容のMD5になるため、skip_unchanged用に元ファイルのMD5を保存する
+            # （MD5は圧縮のための読み込みと同時に計算し、ファイルを2回読まない）
+            source_md5 = hashlib.md5()
+            with compress_zstd(file, self.options.compression_level, source_md5) as body:
+                metadata = {
+                    'uncompressed-size': str(file_info.size),
+                    'source-md5': source_md5.hexdigest(),
+                }
+                self.s3_client.put_object(
+                    Bucket=bucket,
+                    Key=s3_key,
+                    Body=body,
+                    ContentEncoding='zstd',
+                    Metadata=metadata,
+                    **extra_args
+                )
+                
+    def _execute_upload(self, file_info: FileInfo, bucket: str, s3_key: str,
+                        done: Callable[[UploadResult], None]):
         """実際のアップロード処理"""
+        progress_tracker = None
         try:
             # プログレストラッカー
-            progress_tracker = None
-            if self.options.enable_progress:
+            if self.options.enable_progress and file_info.size >= self.PROGRESS_MIN_SIZE:
                 progress_tracker = self.progress_manager.create_tracker(
                     file_info.path, file_info.size, file_info.name
                 )
             
             # アップロード実行
-            self.s3_client.upload_file(
-                file_info.path,
-                bucket,
-                s3_key,
-                Config=self.transfer_config,
-                Callback=progress_tracker if progress_tracker else None
-            )
+            if file_info.size > self.options.parallel_threshold_mb * 1024 * 1024:
+                # 巨大ファイルはパートを直接並列アップロード
+                self.multipart_uploader.upload(
+                    file_info.path, bucket, s3_key, callback=progress_tracker
+                )
+            elif file_info.size > self.options.multipart_threshold:
+                # ファイル名で渡し、各パートをディスクから直接読み出させる
+                # （ファイルオブジェクトを渡すとパート全体がメモリ上に読み込まれる）
+                # 転送の完了は待たず、結果は完了時にTransferManagerのスレッドからdoneへ渡す
+                def on_done(error: Optional[BaseException]):
+                    # s3transferが開いたファイルにはfadviseできないため、読み終えてから落とす
+                    drop_page_cache(file_info.path)
+                    done(self._finish_upload(file_info, bucket, s3_key, progress_tracker, error))
+                    
+                subscribers = [_DoneSubscriber(on_done)]
+                if progress_tracker:
+                    subscribers.insert(0, ProgressCallbackInvoker(progress_tracker))
+                self.transfer_manager.upload(
+                    file_info.path, bucket, s3_key, subscribers=subscribers
+                )
+                return
+            else:
+                # 閾値以下のファイルはTransferManagerを介さず1回のPutObjectで送る
+                # （小さなファイルが大量にある場合、タスク投入のオーバーヘッドが支配的になるため）
+                self._put_object(file_info, bucket, s3_key)
+                if progress_tracker:
+                    progress_tracker(file_info.size)
+        except Exception as e:
+            done(self._finish_upload(file_info, bucket, s3_key, progress_tracker, e))
+            return
             
-            if progress_tracker:
-                progress_tracker.complete()
-                self.progress_manager.remove_tracker(file_info.path)
-                
-            self.logger.info(f"Successfully uploaded {file_info.path} to {bucket}/{s3_key}")
-            return UploadResult(file_info.path, success=True)
+        done(self._finish_upload(file_info, bucket, s3_key, progress_tracker))
+        
+    def _finish_upload(self, file_info: FileInfo, bucket: str, s3_key: str,
+                       progress_tracker, error: Optional[BaseException] = None) -> UploadResult:
+        """アップロードの終了処理をしてUploadResultを返す"""
+        if error is not None:
+            return self._error_result(file_info, error)
             
-        except FileNotFoundError:
-            error = f"File not found: {file_info.path}"
-            self.logger.error(error)
-            return UploadResult(file_info.path, success=False, error=error)
-        except PermissionError:
-            error = f"Permission denied for file: {file_info.path}"
-            self.logger.error(error)
-            return UploadResult(file_info.path, success=False, error=error)
-        except (NoCredentialsError, ClientError) as e:
-            error = f"AWS error uploading {file_info.path}: {e}"
-            self.logger.error(error)
-            return UploadResult(file_info.path, success=False, error=str(e))
+        if progress_tracker:
+            progress_tracker.complete()
+            self.progress_manager.remove_tracker(file_info.path)
+            
+        # ファイル単位のログはDEBUGのみ（件数が多いとログのロックが競合するため）
+        self.logger.debug("Successfully uploaded %s to %s/%s", file_info.path, bucket, s3_key)
+        return UploadResult(file_info.path, success=True)
+        
+    def _error_result(self, file_info: FileInfo, error: BaseException) -> UploadResult:
+        """例外をログに出力し、失敗のUploadResultに変換"""
+        if isinstance(error, FileNotFoundError):
+            message = f"File not found: {file_info.path}"
+            self.logger.error(message)
+            return UploadResult(file_info.path, success=False, error=message)
+        if isinstance(error, PermissionError):
+            message = f"Permission denied for file: {file_info.path}"
+            self.logger.error(message)
+            return UploadResult(file_info.path, success=False, error=message)
+        if isinstance(error, (NoCredentialsError, ClientError)):
+            self.logger.error("AWS error uploading %s: %s", file_info.path, error)
+        else:
+            self.logger.error("Unexpected error uploading %s: %s", file_info.path, error)
+        return UploadResult(file_info.path, success=False, error=str(error))
+
+
+class _DoneSubscriber(BaseSubscriber):
+    """転送の完了時に、失敗していればその例外を（成功ならNoneを）渡してコールバックを呼ぶ"""
+    
+    def __init__(self, callback: Callable[[Optional[BaseException]], None]):
+        self._callback = callback
+        
+    def on_done(self, future, **kwargs):
+        try:
+            future.result()
         except Exception as e:
-            error = f"Unexpected error uploading {file_info.path}: {e}"
-            self.logger.error(error)
-            return UploadResult(file_info.path, success=False, error=str(e))
+            self._callback(e)
+            return
+        self._callback(None)
 
 
 class ParallelUploadExecutor:
     """並列アップロード実行"""
     
+    # 進捗サマリーをINFOで出力する間隔（ファイル数・秒数のいずれか）
+    PROGRESS_LOG_INTERVAL_FILES = 1000
+    PROGRESS_LOG_INTERVAL_SECONDS = 5.0
+    
     def __init__(self, executor: UploadExecutor, max_workers: int = 2):
         self.executor = executor
         self.max_workers = max_workers
-        self.logger = LoggerManager.get_logger()
+        self.logger = logger
+        # ワーカースレッドはupload_filesの呼び出し間で使い回す
+        # （parallel_tasksで複数タスクから同時に呼ばれても並列数が減らないよう、その分を確保する）
+        # ワーカーが転送の完了まで待つのは、変更判定のHEAD・PutObjectで送る小さなファイル・
+        # パートを直接並列アップロードする巨大ファイルのみ。TransferManagerに渡すファイルは
+        # 投入だけして次のファイルへ進み、完了はupload_filesの最後にまとめて待つ
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers * max(1, executor.options.parallel_tasks),
+            thread_name_prefix="s3-upload"
+        )
         
-    def upload_files(self, upload_tasks: List[Tuple[FileInfo, str, str]]) -> Tuple[int, int]:
+    def close(self):
+        """ワーカースレッドを終了"""
+        self._pool.shutdown(wait=True)
+        
+    def __enter__(self) -> "ParallelUploadExecutor":
+        return self
+        
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        
+    def upload_files(self, upload_tasks: Iterable[Tuple[FileInfo, str, str]]) -> Tuple[int, int]:
         """複数ファイルを並列でアップロード
         
+        ファイル一覧は一括で展開せず、上限付きキューを介してワーカーに渡すため、
+        スキャンとアップロードが並行して進みメモリ使用量も一定に保たれる。
+        
         Args:
-            upload_tasks: (FileInfo, bucket, s3_key) のタプルのリスト
+            upload_tasks: (FileInfo, bucket, s3_key) のタプルを生成するイテラブル
             
         Returns:
             (成功数, 失敗数) のタプル
         """
-        total_files = len(upload_tasks)
-        self.logger.info(
-            f"Starting parallel upload of {total_files} files with {self.max_workers} workers"
-        )
+        if self.executor.options.dry_run:
+            return self._plan_files(upload_tasks)
+            
+        self.logger.info("Starting parallel upload with %d workers", self.max_workers)
         
-        successful = 0
-        failed = 0
+        work_queue: queue.Queue = queue.Queue(maxsize=self.max_workers * 4)
+        # 完了件数は呼び出しごとに数える（並行するタスクの件数と混ざらないようにする）
+        # 完了を待つ転送は、TransferManagerが同時に送れるパート数とワーカー数の和までに抑える
+        progress = _BatchProgress(self.max_workers + self.executor.transfer_config.max_concurrency)
         
-        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
-            # タスクを投入
-            future_to_task = {
-                pool.submit(self.executor.upload_file, file_info, bucket, s3_key): (file_info, bucket, s3_key)
-                for file_info, bucket, s3_key in upload_tasks
-            }
+        workers = [
+            self._pool.submit(self._worker, work_queue, progress) for _ in range(self.max_workers)
+        ]
+        try:
+            for upload_task in upload_tasks:
+                work_queue.put(upload_task)
+        finally:
+            # 終了の合図をワーカー数だけ投入
+            for _ in workers:
+                work_queue.put(None)
+                
+        for worker in workers:
+            worker.result()
+        # TransferManagerに投入した転送の完了を待って結果を集計
+        return progress.wait()
+        
+    def _plan_files(self, upload_tasks: Iterable[Tuple[FileInfo, str, str]]) -> Tuple[int, int]:
+        """ドライラン: スレッドを使わずに件数だけ数え、結果は1行にまとめて出力
+        
+        転送ログが設定されていれば、アップロード予定のファイルを "planned" として記録する。
+        """
+        transfer_logger = self.executor.transfer_logger
+        planned = 0
+        for file_info, bucket, s3_key in upload_tasks:
+            planned += 1
+            if transfer_logger is not None:
+                transfer_logger.record(file_info.path, bucket, s3_key, "planned", file_info.size)
+                
+        self.logger.info("[DRY RUN]: Would upload %d files", planned)
+        return planned, 0
+        
+    def _worker(self, work_queue: queue.Queue, progress: '_BatchProgress'):
+        """キューからタスクを取り出してアップロードを開始するワーカー"""
+        while True:
+            upload_task = work_queue.get()
+            if upload_task is None:
+                return
+                
+            file_info, bucket, s3_key = upload_task
+            progress.start()
+            try:
+                future = self.executor.start_upload(file_info, bucket, s3_key)
+            except Exception as e:
+                self.logger.error("Upload task exception for %s: %s", file_info.path, e)
+                self._log_progress(progress, success=False)
+                continue
+            future.add_done_callback(
+                lambda future: self._log_progress(progress, success=future.result().success)
+            )
+                
+    def _log_progress(self, progress: '_BatchProgress', success: bool):
+        """完了を数え、一定件数・一定時間ごとに完了件数をまとめて出力"""
+        completed = progress.finish(success)
+        now = time.monotonic()
+        if (completed % self.PROGRESS_LOG_INTERVAL_FILES == 0
+                or now - progress.last_log >= self.PROGRESS_LOG_INTERVAL_SECONDS):
+            progress.last_log = now
+            self.logger.info("Processed %d files", completed)
+
+
+class _BatchProgress:
+    """upload_filesの1回の呼び出しの完了件数・完了待ちの転送数と、最後に出力した時刻"""
+    
+    def __init__(self, max_pending: int):
+        self.successful = 0
+        self.failed = 0
+        self.last_log = time.monotonic()
+        self._max_pending = max_pending
+        self._pending = 0
+        self._condition = threading.Condition()
+        
+    def start(self):
+        """転送を1件開始（完了待ちが上限に達していれば空くまで待つ）"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending < self._max_pending)
+            self._pending += 1
             
-            # 結果を収集
-            for future in as_completed(future_to_task):
-                file_info, _, _ = future_to_task[future]
-                try:
-                    result = future.result()
-                    if result.success:
-                        successful += 1
-                    else:
-                        failed += 1
-                except Exception as e:
-                    self.logger.error(f"Upload task exception for {file_info.path}: {e}")
-                    failed += 1
-                    
-        return successful, failed
\ No newline at end of file
+    def finish(self, success: bool) -> int:
+        """転送を1件完了し、これまでの完了件数を返す"""
+        with self._condition:
+            self._pending -= 1
+            if success:
+                self.successful += 1
+            else:
+                self.failed += 1
+            self._condition.notify_all()
+            return self.successful + self.failed
+            
+    def wait(self) -> Tuple[int, int]:
+        """全ての転送の完了を待って (成功数, 失敗数) を返す"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._pending == 0)
+            return self.successful, self.failed
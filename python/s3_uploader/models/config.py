@@ -1,20 +1,36 @@
-"""設定管理用のデータクラス"""
+"""設定管理用のデータクラス
+
+設定は読み込み後に変更しない。スレッド間で共有でき、変更が必要な場合は
+dataclasses.replaceでコピーを作る。
+"""
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import json
 import os
 import re
 
+from ..utils.json_utils import json_load_file
+
+
+# 読み込み済み設定のキャッシュ（絶対パス -> (mtime_ns, Config)）
+_config_cache: Dict[str, Tuple[int, 'Config']] = {}
+
+# role_arnのARNパターン
+_ROLE_ARN_RE = re.compile(r'^arn:aws:iam::[0-9]{12}:role\/[a-zA-Z0-9+=,.@_-]+$')
+# セッション名は2-64文字の英数字、アンダースコア、ハイフン、ピリオドのみ許可
+_SESSION_NAME_RE = re.compile(r'^[a-zA-Z0-9_.-]{2,64}$')
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class LoggingConfig:
     """ロギング設定"""
     level: str = "INFO"
     format: str = "%(asctime)s - %(levelname)s - %(message)s"
     file: Optional[str] = None
+    transfer_log: Optional[str] = None  # ファイル単位の転送結果(JSONL)の出力先
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AssumeRoleConfig:
     """AssumeRole設定"""
     role_arn: str
@@ -25,8 +41,7 @@ class AssumeRoleConfig:
     def __post_init__(self):
         """AssumeRole設定のバリデーション"""
         # role_arnのARNパターンバリデーション
-        arn_pattern = r'^arn:aws:iam::[0-9]{12}:role\/[a-zA-Z0-9+=,.@_-]+$'
-        if not re.match(arn_pattern, self.role_arn):
+        if not _ROLE_ARN_RE.match(self.role_arn):
             raise ValueError(
                 f"Invalid role_arn format: {self.role_arn}. "
                 "Expected format: arn:aws:iam::ACCOUNT_ID:role/ROLE_NAME"
@@ -39,9 +54,8 @@ class AssumeRoleConfig:
         if not self.session_name.strip():
             raise ValueError("session_name cannot be only whitespace")
         
-        # セッション名は2-64文字の英数字、アンダースコア、ハイフン、ピリオドのみ許可
-        session_name_pattern = r'^[a-zA-Z0-9_.-]{2,64}$'
-        if not re.match(session_name_pattern, self.session_name):
+        # セッション名の形式チェック
+        if not _SESSION_NAME_RE.match(self.session_name):
             raise ValueError(
                 f"Invalid session_name: {self.session_name}. "
                 "Must be 2-64 characters long and contain only alphanumeric characters, "
@@ -56,24 +70,26 @@ class AssumeRoleConfig:
             )
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class AWSConfig:
     """AWS関連の設定"""
     region: str
     profile: Optional[str] = None
     assume_role: Optional[AssumeRoleConfig] = None
+    max_pool_connections: Optional[int] = None  # 未指定なら並列数から算出
 
     def __post_init__(self):
         if self.assume_role:
             if isinstance(self.assume_role, dict):
-                self.assume_role = AssumeRoleConfig(**self.assume_role)
+                # frozenのため__setattr__を経由せずに変換後の値を設定する
+                object.__setattr__(self, "assume_role", AssumeRoleConfig(**self.assume_role))
             elif not isinstance(self.assume_role, AssumeRoleConfig):
                 raise TypeError(
                     f"assume_role must be dict or AssumeRoleConfig, got {type(self.assume_role)}"
                 )
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class UploadOptions:
     """アップロードオプション"""
     multipart_threshold: int = 100 * 1024 * 1024  # 100MB
@@ -88,9 +104,17 @@ class UploadOptions:
     timeout_seconds: int = 300  # 追加
     parallel_uploads: int = 2
     enable_progress: bool = True
+    skip_unchanged: bool = False  # S3上に同一内容があればアップロードしない
+    parallel_threshold_mb: int = 256  # これを超えるファイルはパートを直接並列アップロード
+    auto_tune: bool = False  # 起動時に回線を計測してmax_concurrencyとパートサイズを決める
+    target_bandwidth_mbps: float = 1000.0  # 自動チューニングで目標とする帯域（Mbps）
+    parallel_tasks: int = 1  # 同時に実行するタスク数
+    compress: bool = False  # テキスト系のファイルをzstdで圧縮してアップロード（要zstandard）
+    compression_level: int = 3
+    memory_budget_mb: Optional[int] = None  # 転送中のパートに使うメモリの上限（MB）
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class UploadTask:
     """個別のアップロードタスク"""
     # 必須フィールド（デフォルト値なし）を先に
@@ -104,9 +128,10 @@ class UploadTask:
     s3_key: Optional[str] = None  # ファイルの場合
     s3_key_prefix: Optional[str] = None  # ディレクトリの場合
     recursive: bool = False
+    aggregate: bool = False  # ディレクトリを1つのtarアーカイブとしてアップロード
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Config:
     """メイン設定クラス"""
     logging: LoggingConfig
@@ -116,13 +141,22 @@ class Config:
 
     @classmethod
     def from_file(cls, config_path: str) -> 'Config':
-        """設定ファイルから読み込み"""
+        """設定ファイルから読み込み
+
+        ファイルの更新時刻が変わっていなければ前回パースした結果を返す。
+        """
         if not os.path.exists(config_path):
             raise FileNotFoundError(f"Configuration file {config_path} not found.")
         
+        cache_key = os.path.abspath(config_path)
+        mtime_ns = os.stat(cache_key).st_mtime_ns
+        cached = _config_cache.get(cache_key)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+        
         try:
-            with open(config_path, "r", encoding="utf-8") as file:
-                data = json.load(file)
+            with open(config_path, "rb") as file:
+                data = json_load_file(file)
             
             # 各セクションをパース
             logging_config = LoggingConfig(**data.get("logging", {}))
@@ -134,12 +168,14 @@ class Config:
                 UploadTask(**task) for task in data.get("upload_tasks", [])
             ]
             
-            return cls(
+            config = cls(
                 logging=logging_config,
                 aws=aws_config,
                 options=options,
                 upload_tasks=upload_tasks
             )
+            _config_cache[cache_key] = (mtime_ns, config)
+            return config
             
         except json.JSONDecodeError as e:
             raise ValueError(f"Error decoding JSON from {config_path}: {e}")
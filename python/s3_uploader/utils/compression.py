@@ -0,0 +1,79 @@
+"""アップロード前の圧縮ユーティリティ
+
+zstandardがインストールされている場合のみ圧縮を行う。
+"""
+import mimetypes
+import os
+import shutil
+import tempfile
+from typing import BinaryIO
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# 圧縮済みの一時ファイルをメモリ上に保持する上限（超えるとディスクへ書き出す）
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+# text/* 以外で圧縮が効くContent-Type
+_COMPRESSIBLE_TYPES = frozenset([
+    "application/json",
+    "application/xml",
+    "application/javascript",
+    "application/x-sh",
+    "image/svg+xml",
+])
+
+# mimetypesに登録されていないが圧縮が効く拡張子
+_COMPRESSIBLE_EXTENSIONS = frozenset([".log", ".jsonl", ".ndjson", ".yaml", ".yml"])
+
+
+def compression_available() -> bool:
+    """zstd圧縮が利用できるか"""
+    return zstandard is not None
+
+
+def is_compressible(file_path: str) -> bool:
+    """拡張子から圧縮が効くファイルか判定（圧縮済みのファイルは対象外）"""
+    content_type, encoding = mimetypes.guess_type(file_path)
+    if encoding is not None:
+        return False
+    if content_type is None:
+        return os.path.splitext(file_path)[1].lower() in _COMPRESSIBLE_EXTENSIONS
+    return content_type.startswith("text/") or content_type in _COMPRESSIBLE_TYPES
+
+
+class _HashingReader:
+    """読み出したデータでハッシュを更新しながらsourceを読むラッパー"""
+    
+    def __init__(self, source: BinaryIO, digest):
+        self._source = source
+        self._digest = digest
+        
+    def read(self, size: int = -1) -> bytes:
+        data = self._source.read(size)
+        self._digest.update(data)
+        return data
+
+
+def compress_zstd(source: BinaryIO, level: int = 3, digest=None) -> BinaryIO:
+    """ファイルをzstdで圧縮し、先頭にシークした一時ファイルとして返す
+    
+    PutObjectにはサイズが確定したボディが必要なため、ストリームのまま渡さず
+    一時ファイル（小さければメモリ上）へ書き出す。
+    digest（hashlibのハッシュオブジェクト）を渡すと、圧縮する元データで更新する。
+    """
+    if digest is not None:
+        source = _HashingReader(source, digest)
+    compressed = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        compressor = zstandard.ZstdCompressor(level=level, threads=-1)
+        with compressor.stream_reader(source, closefd=False) as reader:
+            shutil.copyfileobj(reader, compressed)
+        compressed.seek(0)
+    except Exception:
+        compressed.close()
+        raise
+    return compressed
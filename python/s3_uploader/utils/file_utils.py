@@ -1,20 +1,113 @@
 """ファイル操作関連のユーティリティ"""
 import os
+import re
+import stat
+import mmap
 import fnmatch
-from typing import List, Tuple, Generator
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import BinaryIO, List, Tuple, Generator, Optional
 from dataclasses import dataclass
 
 
-@dataclass
+# 出力先はLoggerManager.setupで設定される
+logger = logging.getLogger("s3_uploader")
+
+# ハッシュ計算時に一度に渡すサイズ
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# fnmatch.translateの出力 "(?s:...)\\Z" から本体を取り出す（形式が変わればマッチしない）
+_FNMATCH_TRANSLATION_RE = re.compile(r"\(\?s:(.*)\)\\[Zz]", re.S)
+
+# posix_fadviseはLinuxなど一部のプラットフォームでのみ利用できる
+_HAS_FADVISE = hasattr(os, "posix_fadvise")
+
+
+def fadvise(fd: int, advice: int):
+    """ファイル全体に対してposix_fadviseを発行（未対応の環境やエラーは無視）"""
+    if not _HAS_FADVISE:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, advice)
+    except OSError:
+        pass
+
+
+@contextmanager
+def open_sequential(file_path: str, buffering: int = -1) -> Generator[BinaryIO, None, None]:
+    """アップロード用にファイルを順次読み込みで開く
+    
+    カーネルに先読みを促し、閉じる際には読み終えたページをページキャッシュから落とす。
+    大量のファイルをアップロードしても他のプロセスのキャッシュを追い出さない。
+    """
+    file = open(file_path, "rb", buffering=buffering)
+    try:
+        if _HAS_FADVISE:
+            fadvise(file.fileno(), os.POSIX_FADV_SEQUENTIAL)
+        yield file
+    finally:
+        if _HAS_FADVISE:
+            fadvise(file.fileno(), os.POSIX_FADV_DONTNEED)
+        file.close()
+
+
+def drop_page_cache(file_path: str):
+    """ファイルのページをページキャッシュから落とす（未対応の環境やエラーは無視）
+    
+    ファイル名を渡して他のライブラリに読ませた場合など、open_sequentialを使えない
+    読み込みの後に呼ぶ。
+    """
+    if not _HAS_FADVISE:
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        fadvise(fd, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def file_md5(file_path: str) -> str:
+    """ファイルのMD5をメモリマップ経由で計算（メモリ使用量は一定）"""
+    md5 = hashlib.md5()
+    with open(file_path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            # 空ファイルはmmapできない
+            return md5.hexdigest()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            for offset in range(0, len(view), HASH_CHUNK_SIZE):
+                md5.update(view[offset:offset + HASH_CHUNK_SIZE])
+    return md5.hexdigest()
+
+
+def normalize_key_prefix(prefix: Optional[str]) -> str:
+    """キープレフィックスを空文字または "/" で終わる形に揃える（タスクごとに1度だけ呼ぶ）"""
+    if not prefix:
+        return ""
+    return prefix.rstrip("/") + "/"
+
+
+def make_s3_key(prefix: str, relative_path: str) -> str:
+    """normalize_key_prefix済みのプレフィックスと相対パスを連結してS3キーを作成
+    
+    OSのパス区切り文字は "/" に置き換える。
+    """
+    if os.sep != "/":
+        relative_path = relative_path.replace(os.sep, "/")
+    return prefix + relative_path
+
+
+@dataclass(slots=True)
 class FileInfo:
     """ファイル情報"""
     path: str
     size: int
     relative_path: str
-    
-    @property
-    def name(self) -> str:
-        return os.path.basename(self.path)
+    # スキャン時に分かっているファイル名を保持し、参照のたびにパスから切り出さない
+    name: str
 
 
 class FileScanner:
@@ -22,57 +115,91 @@ class FileScanner:
     
     def __init__(self, exclude_patterns: List[str] = None):
         self.exclude_patterns = exclude_patterns or []
+        # 除外パターンはファイル名用・パス全体用にそれぞれ1つの正規表現へまとめる
+        # パス全体は "*パターン*" と等価な非アンカーの検索にし、先頭の ".*" によるバックトラックを避ける
+        self._name_re = self._compile_patterns(self.exclude_patterns)
+        self._path_re = self._compile_patterns(self.exclude_patterns, anchored=False)
         
-    def should_exclude(self, file_path: str) -> bool:
-        """ファイルが除外パターンに一致するかチェック"""
-        file_name = os.path.basename(file_path)
+    @staticmethod
+    def _compile_patterns(patterns: List[str], anchored: bool = True) -> Optional[re.Pattern]:
+        """globパターンのリストを1つの正規表現にコンパイル"""
+        if not patterns:
+            return None
+        translated = [fnmatch.translate(os.path.normcase(p)) for p in patterns]
+        if anchored:
+            return re.compile("|".join(translated))
+        # translateの結果 "(?s:...)\\Z" から外側のグループと終端アンカーを外す
+        bodies = []
+        for t in translated:
+            match = _FNMATCH_TRANSLATION_RE.fullmatch(t)
+            if match is None:
+                raise ValueError(f"Unexpected fnmatch.translate output: {t!r}")
+            bodies.append(match.group(1))
+        return re.compile("(?s:" + "|".join(bodies) + ")")
         
-        for pattern in self.exclude_patterns:
-            # ファイル名でのマッチ
-            if fnmatch.fnmatch(file_name, pattern):
-                return True
-            # パス全体でのマッチ
-            if fnmatch.fnmatch(file_path, f"*{pattern}*"):
-                return True
-                
-        return False
+    def should_exclude(self, file_path: str, name: Optional[str] = None) -> bool:
+        """ファイルが除外パターンに一致するかチェック
+        
+        ファイル名が分かっている場合（DirEntry.nameなど）はnameに渡すとパスから切り出さない。
+        """
+        if self._name_re is None:
+            return False
+            
+        file_path = os.path.normcase(file_path)
+        name = os.path.basename(file_path) if name is None else os.path.normcase(name)
+        # ファイル名でのマッチ
+        if self._name_re.match(name):
+            return True
+        # パス全体でのマッチ（パターンがパスのどこかに含まれるか）
+        return self._path_re.search(file_path) is not None
         
     def scan_directory(self, directory: str, recursive: bool = False) -> Generator[FileInfo, None, None]:
         """ディレクトリをスキャンしてファイル情報を生成"""
         if not os.path.isdir(directory):
             raise ValueError(f"Not a directory: {directory}")
             
-        if recursive:
-            for root, dirs, files in os.walk(directory):
-                # 除外パターンに一致するディレクトリをスキップ
-                dirs[:] = [d for d in dirs if not self.should_exclude(os.path.join(root, d))]
-                
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if not self.should_exclude(file_path):
-                        relative_path = os.path.relpath(file_path, directory)
+        # os.scandirのDirEntryはファイル種別をキャッシュしているため、
+        # os.walk + os.path.isfile/getsize よりstatの呼び出しが少ない
+        # 相対パスはos.path.relpathを使わず、ディレクトリごとのプレフィックスを連結して作る
+        pending = [(directory, "")]
+        while pending:
+            current, relative_prefix = pending.pop()
+            try:
+                entries = os.scandir(current)
+            except OSError as e:
+                # os.walkと同様に、読み込めないディレクトリはスキップして続行する
+                logger.warning("Skipping unreadable directory %s: %s", current, e)
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        # 除外パターンに一致するディレクトリはスキップ
+                        if recursive and not self.should_exclude(entry.path, entry.name):
+                            pending.append((entry.path, relative_prefix + entry.name + os.sep))
+                    elif entry.is_file() and not self.should_exclude(entry.path, entry.name):
                         yield FileInfo(
-                            path=file_path,
-                            size=os.path.getsize(file_path),
-                            relative_path=relative_path
+                            path=entry.path,
+                            size=entry.stat().st_size,
+                            relative_path=relative_prefix + entry.name,
+                            name=entry.name
                         )
-        else:
-            for item in os.listdir(directory):
-                file_path = os.path.join(directory, item)
-                if os.path.isfile(file_path) and not self.should_exclude(file_path):
-                    yield FileInfo(
-                        path=file_path,
-                        size=os.path.getsize(file_path),
-                        relative_path=item
-                    )
     
-    def get_file_info(self, file_path: str) -> FileInfo:
-        """単一ファイルの情報を取得"""
-        if not os.path.isfile(file_path):
+    def get_file_info(self, file_path: str,
+                      file_stat: Optional[os.stat_result] = None) -> FileInfo:
+        """単一ファイルの情報を取得（stat済みであれば結果を渡すと再取得しない）"""
+        if file_stat is None:
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                raise ValueError(f"Not a file: {file_path}")
+                
+        if not stat.S_ISREG(file_stat.st_mode):
             raise ValueError(f"Not a file: {file_path}")
             
+        name = os.path.basename(file_path)
         return FileInfo(
             path=file_path,
-            size=os.path.getsize(file_path),
-            relative_path=os.path.basename(file_path)
+            size=file_stat.st_size,
+            relative_path=name,
+            name=name
         )
\ No newline at end of file
@@ -0,0 +1,43 @@
+"""JSONエンコード/デコードユーティリティ
+
+orjsonがインストールされていればそちらを使用し、なければ標準のjsonを使用する。
+"""
+import json
+import mmap
+from typing import Any, BinaryIO
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    json_loads = orjson.loads
+
+    def json_load_file(file: BinaryIO) -> Any:
+        """バイナリモードで開いたファイルからJSONを読み込む
+        
+        ファイルをメモリマップしてorjsonに直接渡し、内容をbytesへコピーしない。
+        """
+        try:
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # 空のファイルなどメモリマップできない場合は通常どおり読み込む
+            return orjson.loads(file.read())
+        with mm, memoryview(mm) as view:
+            return orjson.loads(view)
+
+    def json_dumps(obj: Any) -> str:
+        """オブジェクトを1行のJSON文字列にエンコード"""
+        return orjson.dumps(obj).decode("utf-8")
+else:
+    json_loads = json.loads
+
+    def json_load_file(file: BinaryIO) -> Any:
+        """バイナリモードで開いたファイルからJSONを読み込む"""
+        return json.loads(file.read())
+
+    def json_dumps(obj: Any) -> str:
+        """オブジェクトを1行のJSON文字列にエンコード"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
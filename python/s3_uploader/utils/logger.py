@@ -1,14 +1,44 @@
 """ロギング設定ユーティリティ"""
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 from typing import Optional, List
 from ..models.config import LoggingConfig
 
 
+class _CachedTimeFormatter(logging.Formatter):
+    """asctimeの文字列を秒単位でキャッシュするフォーマッター
+    
+    同じ秒に出力されるレコードではtime.strftimeを呼び直さない。
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (エポック秒, フォーマット済み文字列)。複数ハンドラーから使われるため1属性で入れ替える
+        self._cached_time = (None, "")
+        
+    def formatTime(self, record: logging.LogRecord, datefmt: Optional[str] = None) -> str:
+        second = int(record.created)
+        cached_second, cached_text = self._cached_time
+        if cached_second == second:
+            return cached_text
+        text = super().formatTime(record, datefmt)
+        self._cached_time = (second, text)
+        return text
+
+
 class LoggerManager:
-    """ロガーの設定と管理"""
+    """ロガーの設定と管理
+    
+    出力はQueueHandler経由でバックグラウンドのQueueListenerが行う。
+    アップロードスレッドはキューへの追加だけで戻り、ハンドラーのロックや
+    コンソール・ファイルへの書き込みを待たない。
+    """
     
     _logger: Optional[logging.Logger] = None
+    _listener: Optional[logging.handlers.QueueListener] = None
     
     @classmethod
     def setup(cls, config: LoggingConfig) -> logging.Logger:
@@ -23,7 +53,7 @@ class LoggerManager:
         handlers: List[logging.Handler] = []
         
         # フォーマッターの作成
-        formatter = logging.Formatter(
+        formatter = _CachedTimeFormatter(
             config.format,
             datefmt="%Y-%m-%d %H:%M:%S"
         )
@@ -43,14 +73,43 @@ class LoggerManager:
             file_handler.setFormatter(formatter)
             handlers.append(file_handler)
         
+        # 実際の出力はリスナースレッドで行う
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(
+            log_queue, *handlers, respect_handler_level=True
+        )
+        listener.start()
+        # 終了時にキューに残ったレコードを書き出す
+        atexit.register(listener.stop)
+        
         # ロガーの設定
         logger = logging.getLogger("s3_uploader")
         logger.setLevel(log_level)
-        logger.handlers = handlers
+        logger.handlers = [logging.handlers.QueueHandler(log_queue)]
         
         cls._logger = logger
+        cls._listener = listener
         return logger
     
+    @classmethod
+    def shutdown(cls):
+        """キューに残ったログを書き出してリスナーを終了
+        
+        以降のログはQueueHandlerを外して元のハンドラーで直接出力する
+        （ハンドラーはプロセス終了時にloggingが閉じる）。2回目以降の呼び出しは何もしない。
+        """
+        listener = cls._listener
+        if listener is None:
+            return
+            
+        listener.stop()
+        atexit.unregister(listener.stop)
+        cls._logger.handlers = list(listener.handlers)
+        for handler in listener.handlers:
+            handler.flush()
+        cls._listener = None
+        cls._logger = None
+        
     @classmethod
     def get_logger(cls) -> logging.Logger:
         """設定済みのロガーを取得"""
@@ -1,60 +1,92 @@
 """アップロード進捗管理"""
 import time
 import threading
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 
 class ProgressTracker:
-    """単一ファイルのアップロード進捗を追跡"""
+    """単一ファイルのアップロード進捗を追跡
+    
+    コールバックは転送スレッドごとのカウンタに加算するだけにし、
+    合計の算出と表示は一定量・一定間隔でのみ行う。
+    """
+    
+    # 進捗表示の最小間隔（秒）
+    DISPLAY_INTERVAL = 0.1
+    # スレッドごとにこのバイト数が溜まるまでは時刻も確認しない（s3transferの集約サイズと同じ）
+    DISPLAY_AGGREGATE_SIZE = 256 * 1024
     
     def __init__(self, total_size: int, filename: str):
         self.total_size = total_size
         self.filename = filename
-        self.uploaded_size = 0
-        self.lock = threading.Lock()
-        self.start_time = time.time()
+        self.start_time = time.monotonic()
+        self._local = threading.local()
+        self._shards: List[List[int]] = []
+        self._shards_lock = threading.Lock()
+        self._last_display = 0.0
+        
+    @property
+    def uploaded_size(self) -> int:
+        """転送済みバイト数（全スレッドの合計）"""
+        return sum(shard[0] for shard in self._shards)
         
     def __call__(self, bytes_transferred: int):
         """boto3のコールバック関数として使用"""
-        with self.lock:
-            self.uploaded_size += bytes_transferred
-            self._display_progress()
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            # スレッドごとに1度だけ登録する（[累計, 前回確認以降の量]）
+            shard = self._local.shard = [0, 0]
+            with self._shards_lock:
+                self._shards.append(shard)
+        shard[0] += bytes_transferred
+        shard[1] += bytes_transferred
+        if shard[1] < self.DISPLAY_AGGREGATE_SIZE:
+            return
+        shard[1] = 0
+        
+        now = time.monotonic()
+        if now - self._last_display < self.DISPLAY_INTERVAL:
+            return
+        self._last_display = now
+        self._display_progress()
             
     def _display_progress(self):
         """進捗を表示"""
         if self.total_size == 0:
             return
             
-        progress = (self.uploaded_size / self.total_size) * 100
-        elapsed_time = time.time() - self.start_time
+        uploaded_size = self.uploaded_size
+        progress = (uploaded_size / self.total_size) * 100
+        elapsed_time = time.monotonic() - self.start_time
         
         if elapsed_time > 0:
-            speed = self.uploaded_size / elapsed_time / 1024 / 1024  # MB/s
-            eta = (self.total_size - self.uploaded_size) / (self.uploaded_size / elapsed_time) if self.uploaded_size > 0 else 0
+            speed = uploaded_size / elapsed_time / 1024 / 1024  # MB/s
+            eta = (self.total_size - uploaded_size) / (uploaded_size / elapsed_time) if uploaded_size > 0 else 0
             
-            print(f"\r{self.filename}: {progress:.1f}% ({self.uploaded_size}/{self.total_size}) "
+            print(f"\r{self.filename}: {progress:.1f}% ({uploaded_size}/{self.total_size}) "
                   f"- {speed:.2f} MB/s - ETA: {eta:.0f}s", end="", flush=True)
     
     def complete(self):
         """アップロード完了"""
-        elapsed_time = time.time() - self.start_time
+        elapsed_time = time.monotonic() - self.start_time
         speed = self.total_size / elapsed_time / 1024 / 1024 if elapsed_time > 0 else 0
         print(f"\r{self.filename}: Complete! - {speed:.2f} MB/s - {elapsed_time:.1f}s")
 
 
 class ProgressManager:
-    """複数のアップロードタスクの進捗を管理"""
+    """複数のアップロードタスクの進捗を管理
+    
+    辞書への追加・取得・削除はそれぞれ単一の操作でスレッドセーフなため、ロックは使わない。
+    """
     
     def __init__(self):
         self.trackers: Dict[str, ProgressTracker] = {}
-        self.lock = threading.Lock()
         
     def create_tracker(self, task_id: str, total_size: int, filename: str) -> ProgressTracker:
         """新しいトラッカーを作成"""
-        with self.lock:
-            tracker = ProgressTracker(total_size, filename)
-            self.trackers[task_id] = tracker
-            return tracker
+        tracker = ProgressTracker(total_size, filename)
+        self.trackers[task_id] = tracker
+        return tracker
     
     def get_tracker(self, task_id: str) -> Optional[ProgressTracker]:
         """既存のトラッカーを取得"""
@@ -62,5 +94,4 @@ class ProgressManager:
     
     def remove_tracker(self, task_id: str):
         """完了したトラッカーを削除"""
-        with self.lock:
-            self.trackers.pop(task_id, None)
\ No newline at end of file
+        self.trackers.pop(task_id, None)
\ No newline at end of file
@@ -0,0 +1,56 @@
+"""ファイル単位の転送結果をJSONLで記録"""
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from typing import Optional
+
+from .json_utils import json_dumps
+
+
+class TransferLogger:
+    """転送結果を1ファイル1行のJSONで記録するロガー
+    
+    ディスクへの書き込みはQueueListenerのスレッドで行うため、
+    アップロードスレッドはキューへの追加のみでブロックしない。
+    """
+    
+    def __init__(self, file_path: str):
+        log_dir = os.path.dirname(file_path)
+        if log_dir and not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+            
+        file_handler = logging.FileHandler(file_path, encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+        
+        log_queue: queue.Queue = queue.Queue(-1)
+        self._listener = logging.handlers.QueueListener(log_queue, file_handler)
+        self._listener.start()
+        
+        # getLoggerで共有されるロガーを使うと、複数のインスタンスが同時にあるとき
+        # 後から作られたインスタンスのファイルへ記録が流れてしまうため、専用のロガーを持つ
+        self._logger = logging.Logger("s3_uploader.transfer", logging.INFO)
+        self._logger.propagate = False
+        self._logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        
+    def record(self, path: str, bucket: str, s3_key: str, status: str,
+               size: int, error: Optional[str] = None):
+        """1ファイル分の転送結果を記録"""
+        record = {
+            "ts": time.time(),
+            "path": path,
+            "bucket": bucket,
+            "key": s3_key,
+            "status": status,
+            "bytes": size,
+        }
+        if error:
+            record["error"] = error
+        self._logger.info(json_dumps(record))
+        
+    def close(self):
+        """キューに残った記録を書き出して終了"""
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
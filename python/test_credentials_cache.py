@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""AssumeRole認証情報キャッシュのテスト"""
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from s3_uploader.core import s3_client
+from s3_uploader.core.s3_client import S3ClientManager
+from s3_uploader.models.config import AWSConfig, AssumeRoleConfig
+
+
+def _manager(duration_seconds: int = 3600) -> S3ClientManager:
+    return S3ClientManager(AWSConfig(
+        region="ap-northeast-1",
+        assume_role=AssumeRoleConfig(
+            role_arn="arn:aws:iam::123456789012:role/test-role",
+            session_name="test-session",
+            duration_seconds=duration_seconds
+        )
+    ))
+
+
+def _credentials(expires_in: timedelta) -> dict:
+    return {
+        'access_key_id': 'AKIA',
+        'secret_access_key': 'secret',
+        'session_token': 'token',
+        'expiration': (datetime.now(timezone.utc) + expires_in).isoformat()
+    }
+
+
+@contextmanager
+def _cache_path():
+    """キャッシュファイルの保存先を一時ディレクトリに差し替える"""
+    original = s3_client.CREDENTIALS_CACHE_PATH
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        s3_client.CREDENTIALS_CACHE_PATH = os.path.join(tmp_dir, "creds.json")
+        try:
+            yield s3_client.CREDENTIALS_CACHE_PATH
+        finally:
+            s3_client.CREDENTIALS_CACHE_PATH = original
+
+
+def test_cache_permissions():
+    """既存のキャッシュファイルのパーミッションが緩くても0600で保存されるか確認"""
+    manager = _manager()
+    cache_key = manager._credentials_cache_key()
+    with _cache_path() as path:
+        with open(path, "w") as file:
+            file.write("{}")
+        os.chmod(path, 0o644)
+
+        credentials = _credentials(timedelta(hours=1))
+        manager._save_cached_credentials(cache_key, credentials)
+
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+        assert manager._load_cached_credentials(cache_key) == credentials
+        assert os.listdir(os.path.dirname(path)) == ["creds.json"]
+    print("✅ キャッシュファイルが0600で保存される")
+
+
+def test_cache_skips_credentials_near_expiry():
+    """botocoreがすぐに更新する残り時間の認証情報はキャッシュから返さないか確認"""
+    manager = _manager()
+    cache_key = manager._credentials_cache_key()
+    with _cache_path():
+        manager._save_cached_credentials(cache_key, _credentials(timedelta(minutes=12)))
+        assert manager._load_cached_credentials(cache_key) is None
+
+        credentials = _credentials(timedelta(minutes=30))
+        manager._save_cached_credentials(cache_key, credentials)
+        assert manager._load_cached_credentials(cache_key) == credentials
+    print("✅ 期限の近い認証情報はキャッシュから返さない")
+
+
+def test_short_role_not_refreshed_on_every_request():
+    """900秒のロールで、取得直後の認証情報が使うたびに更新されないか確認"""
+    manager = _manager(duration_seconds=900)
+    refreshes = []
+
+    def refresh():
+        refreshes.append(1)
+        return manager._credentials_metadata(_credentials(timedelta(seconds=900)))
+
+    manager._refresh_credentials = refresh
+    credentials = manager._create_refreshable_credentials(_credentials(timedelta(seconds=900)))
+    for _ in range(20):
+        credentials.get_frozen_credentials()
+    assert refreshes == []
+
+    # 残り12分の認証情報は、900秒のロールではキャッシュから返す
+    cache_key = manager._credentials_cache_key()
+    with _cache_path():
+        credentials = _credentials(timedelta(minutes=12))
+        manager._save_cached_credentials(cache_key, credentials)
+        assert manager._load_cached_credentials(cache_key) == credentials
+    print("✅ 有効期間の短いロールでも認証情報を使うたびに更新しない")
+
+
+def test_client_cache_separates_durations():
+    """有効期間の異なるロールで同じクライアント（セッション）を共有しないか確認"""
+    assert _manager(900)._client_cache_key() != _manager(3600)._client_cache_key()
+    assert _manager(3600)._client_cache_key() == _manager(3600)._client_cache_key()
+    print("✅ 有効期間ごとに別のクライアントをキャッシュする")
+
+
+if __name__ == "__main__":
+    test_cache_permissions()
+    test_cache_skips_credentials_near_expiry()
+    test_short_role_not_refreshed_on_every_request()
+    test_client_cache_separates_durations()
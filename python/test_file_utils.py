@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""ファイルユーティリティのテスト"""
+import fnmatch
+import hashlib
+import os
+import tempfile
+
+from s3_uploader.utils.file_utils import FileScanner, file_md5, make_s3_key, normalize_key_prefix
+
+PATTERNS = ["*.tmp", "*.lock", "__pycache__", ".DS_Store", "*.swp", "Thumbs.db"]
+
+
+def _fnmatch_exclude(file_path):
+    """元のfnmatchベースの判定"""
+    file_name = os.path.basename(file_path)
+    return any(
+        fnmatch.fnmatch(file_name, p) or fnmatch.fnmatch(file_path, f"*{p}*")
+        for p in PATTERNS
+    )
+
+
+def test_should_exclude():
+    """コンパイル済み正規表現の判定がfnmatchと一致するか確認"""
+    scanner = FileScanner(PATTERNS)
+    paths = [
+        "data/a.txt",
+        "data/a.tmp",
+        "data/__pycache__/mod.pyc",
+        "data/.DS_Store",
+        "data/sub.lock/file.txt",
+        "data/Thumbs.db.bak",
+        "data/notes.swp.txt",
+    ]
+    for path in paths:
+        assert scanner.should_exclude(path) == _fnmatch_exclude(path), path
+    
+    assert not FileScanner().should_exclude("data/a.tmp")
+    print("✅ 除外パターンの判定が一致")
+
+
+def test_file_md5():
+    """mmap経由のMD5がhashlibの結果と一致するか確認"""
+    for data in [b"", b"hello", os.urandom(3 * 1024 * 1024 + 7)]:
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            tmp.write(data)
+        try:
+            assert file_md5(tmp.name) == hashlib.md5(data).hexdigest()
+        finally:
+            os.remove(tmp.name)
+    print("✅ MD5の計算結果が一致")
+
+
+def test_scan_skips_unreadable_directory():
+    """読み込めないサブディレクトリがあってもスキャンを続行するか確認"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for sub in ("readable", "unreadable"):
+            os.makedirs(os.path.join(tmp_dir, sub))
+            with open(os.path.join(tmp_dir, sub, "a.txt"), "w") as file:
+                file.write(sub)
+        unreadable = os.path.join(tmp_dir, "unreadable")
+        
+        # rootではパーミッションで読み込みを拒否できないため、scandirを差し替える
+        original_scandir = os.scandir
+        def scandir(path):
+            if path == unreadable:
+                raise PermissionError(13, "Permission denied", path)
+            return original_scandir(path)
+        os.scandir = scandir
+        try:
+            files = list(FileScanner().scan_directory(tmp_dir, recursive=True))
+        finally:
+            os.scandir = original_scandir
+            
+        assert [f.relative_path for f in files] == [os.path.join("readable", "a.txt")]
+    print("✅ 読み込めないディレクトリをスキップ")
+
+
+def test_make_s3_key():
+    """プレフィックスの末尾の "/" の有無に関わらず1つの "/" で連結されるか確認"""
+    relative_path = os.path.join("sub", "a.txt")
+    for prefix, expected in [
+        (None, "sub/a.txt"),
+        ("", "sub/a.txt"),
+        ("exports", "exports/sub/a.txt"),
+        ("exports/", "exports/sub/a.txt"),
+        ("exports//", "exports/sub/a.txt"),
+    ]:
+        assert make_s3_key(normalize_key_prefix(prefix), relative_path) == expected, prefix
+    print("✅ S3キーの連結結果が一致")
+
+
+if __name__ == "__main__":
+    test_should_exclude()
+    test_file_md5()
+    test_scan_skips_unreadable_directory()
+    test_make_s3_key()
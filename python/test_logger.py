@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 """ロガーのテスト"""
-from s3_uploader.models.config import Config
+import logging.handlers
+import os
+import tempfile
+
+from s3_uploader.models.config import Config, LoggingConfig
 from s3_uploader.utils.logger import LoggerManager
 
 def test_logger():
@@ -15,5 +19,30 @@ def test_logger():
     
     print("\nログファイルも確認してみて: logs/s3_uploader.log")
 
+def test_logger_shutdown():
+    """shutdown後のログもファイルに出力され、再度のshutdownが何もしないか確認"""
+    LoggerManager.shutdown()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "uploader.log")
+        logger = LoggerManager.setup(LoggingConfig(file=path))
+        try:
+            logger.info("before shutdown")
+            LoggerManager.shutdown()
+            LoggerManager.shutdown()
+            assert not any(
+                isinstance(handler, logging.handlers.QueueHandler) for handler in logger.handlers
+            )
+            logger.info("after shutdown")
+            with open(path, encoding="utf-8") as file:
+                lines = file.read().splitlines()
+            assert [line.rsplit(" - ", 1)[1] for line in lines] == ["before shutdown", "after shutdown"]
+        finally:
+            for handler in logger.handlers:
+                handler.close()
+            logger.handlers = []
+    print("✅ shutdown後のログも失われない")
+
+
 if __name__ == "__main__":
-    test_logger()
\ No newline at end of file
+    test_logger()
+    test_logger_shutdown()
\ No newline at end of file
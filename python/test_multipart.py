@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""マルチパートアップロードのテスト"""
+import os
+import tempfile
+import threading
+import time
+
+from s3_uploader.core import multipart
+from s3_uploader.core.multipart import MultipartStreamWriter, MultipartUploader
+
+
+class FakeS3Client:
+    """最初のパートだけ失敗し、それ以外は少し待ってから成功するS3クライアント"""
+
+    def __init__(self, fail_part: int = 1, delay: float = 0.05):
+        self.fail_part = fail_part
+        self.delay = delay
+        self.uploaded_parts = []
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def create_multipart_upload(self, **kwargs):
+        self.calls.append("create_multipart_upload")
+        return {'UploadId': 'upload-id'}
+
+    def upload_part(self, PartNumber, Body, **kwargs):
+        with self._lock:
+            self.uploaded_parts.append(PartNumber)
+        if PartNumber == self.fail_part:
+            raise RuntimeError(f"part {PartNumber} failed")
+        time.sleep(self.delay)
+        return {'ETag': f'"etag-{PartNumber}"'}
+
+    def complete_multipart_upload(self, **kwargs):
+        self.calls.append("complete_multipart_upload")
+
+    def abort_multipart_upload(self, **kwargs):
+        self.calls.append("abort_multipart_upload")
+
+
+def test_upload_stops_after_failed_part():
+    """パートが失敗したら残りのパートを送らずに中止するか確認"""
+    part_count = 6
+    client = FakeS3Client()
+    uploader = MultipartUploader(client, MultipartUploader.MIN_PART_SIZE, max_workers=2)
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.truncate(part_count * MultipartUploader.MIN_PART_SIZE)
+    try:
+        try:
+            uploader.upload(tmp.name, "bucket", "key")
+            raise AssertionError("upload should fail")
+        except RuntimeError:
+            pass
+    finally:
+        os.remove(tmp.name)
+
+    assert len(client.uploaded_parts) < part_count, client.uploaded_parts
+    assert client.calls == ["create_multipart_upload", "abort_multipart_upload"]
+    print(f"✅ 失敗後に中止（{len(client.uploaded_parts)}/{part_count} パート送信）")
+
+
+def test_stream_writer_stops_after_failed_part():
+    """ストリームのパートが失敗したら以降のwriteで例外になり、中止できるか確認"""
+    part_count = 7
+    client = FakeS3Client()
+    writer = MultipartStreamWriter(client, "bucket", "key", "upload-id", part_size=4, max_workers=1)
+    try:
+        for _ in range(part_count):
+            writer.write(b"data")
+        writer.complete()
+        raise AssertionError("write should fail")
+    except RuntimeError:
+        writer.abort()
+
+    assert len(client.uploaded_parts) < part_count, client.uploaded_parts
+    assert client.calls == ["abort_multipart_upload"]
+    print(f"✅ ストリームが失敗後に中止（{len(client.uploaded_parts)}/{part_count} パート送信）")
+
+
+def test_stream_writer_completes_parts_in_order():
+    """ストリームのパートが番号順に完了リストへ渡されるか確認"""
+    client = FakeS3Client(fail_part=0, delay=0)
+    completed = []
+    client.complete_multipart_upload = lambda **kwargs: completed.append(kwargs)
+    writer = MultipartStreamWriter(client, "bucket", "key", "upload-id", part_size=4, max_workers=3)
+    writer.write(b"0123456789")
+    writer.complete()
+
+    parts = completed[0]['MultipartUpload']['Parts']
+    assert [part['PartNumber'] for part in parts] == [1, 2, 3]
+    assert [part['ETag'] for part in parts] == ['"etag-1"', '"etag-2"', '"etag-3"']
+    print("✅ ストリームのパートを番号順に完了")
+
+
+def test_upload_without_memory_map():
+    """メモリマップできないファイルをプールのバッファ経由で正しく分割して送るか確認"""
+    client = FakeS3Client(fail_part=0, delay=0)
+    bodies = {}
+    original_upload_part = client.upload_part
+
+    def upload_part(PartNumber, Body, **kwargs):
+        bodies[PartNumber] = Body.read()
+        return original_upload_part(PartNumber=PartNumber, Body=Body, **kwargs)
+
+    def unmappable(file_path):
+        raise OSError("mmap not supported")
+
+    client.upload_part = upload_part
+    uploader = MultipartUploader(client, MultipartUploader.MIN_PART_SIZE, max_workers=2)
+    data = os.urandom(2 * MultipartUploader.MIN_PART_SIZE + 12345)
+    original_mapped_file = multipart._MappedFile
+    multipart._MappedFile = unmappable
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        tmp.write(data)
+    try:
+        uploader.upload(tmp.name, "bucket", "key")
+    finally:
+        multipart._MappedFile = original_mapped_file
+        os.remove(tmp.name)
+
+    assert sorted(bodies) == [1, 2, 3]
+    assert b"".join(bodies[number] for number in sorted(bodies)) == data
+    assert client.calls == ["create_multipart_upload", "complete_multipart_upload"]
+    print("✅ メモリマップできないファイルもパートに分割して送信")
+
+
+if __name__ == "__main__":
+    test_upload_stops_after_failed_part()
+    test_stream_writer_stops_after_failed_part()
+    test_stream_writer_completes_parts_in_order()
+    test_upload_without_memory_map()
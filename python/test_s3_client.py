@@ -22,13 +22,13 @@ def test_s3_client():
         print("✅ S3クライアントの作成成功！")
         print(f"アクセス可能なバケット数: {len(response['Buckets'])}")
         
-        # 設定されているバケットの存在確認
-        for task in config.upload_tasks:
+        # 設定されているバケットの存在確認（同じバケットは1度だけ確認）
+        for bucket in dict.fromkeys(task.bucket for task in config.upload_tasks):
             try:
-                s3_client.head_bucket(Bucket=task.bucket)
-                print(f"✅ バケット '{task.bucket}' にアクセス可能")
+                s3_client.head_bucket(Bucket=bucket)
+                print(f"✅ バケット '{bucket}' にアクセス可能")
             except Exception as e:
-                print(f"❌ バケット '{task.bucket}' にアクセスできません: {e}")
+                print(f"❌ バケット '{bucket}' にアクセスできません: {e}")
                 
     except Exception as e:
         print(f"❌ S3クライアントの作成に失敗: {e}")
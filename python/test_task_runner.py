@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""タスク実行のテスト（S3へのリクエストはbotocoreのイベントで応答を差し替える）"""
+import io
+import json
+import os
+import tarfile
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from s3_uploader.core.task_runner import TaskRunner
+from s3_uploader.core.transfer import TransferConfigManager
+from s3_uploader.models.config import AWSConfig, Config, LoggingConfig, UploadOptions, UploadTask
+
+
+@contextmanager
+def _stub_s3(s3_client, responses=None):
+    """S3クライアントのリクエストを送信せずに応答し、(操作名, APIパラメータ) を記録する"""
+    responses = responses or {}
+    calls = []
+    lock = threading.Lock()
+
+    def record(params, model, **kwargs):
+        with lock:
+            calls.append((model.name, params))
+
+    def respond(model, **kwargs):
+        response = responses.get(model.name, {})
+        http_response = type("HTTPResponse", (), {"status_code": 200})()
+        return http_response, dict(response, ResponseMetadata={'HTTPStatusCode': 200})
+
+    s3_client.meta.events.register('before-parameter-build.s3.*', record)
+    s3_client.meta.events.register('before-call.s3.*', respond)
+    try:
+        yield calls
+    finally:
+        s3_client.meta.events.unregister('before-parameter-build.s3.*', record)
+        s3_client.meta.events.unregister('before-call.s3.*', respond)
+
+
+def _body_bytes(body) -> bytes:
+    """記録したリクエストボディの内容（botocoreはbytesをBytesIOに包む）"""
+    return body if isinstance(body, bytes) else body.getvalue()
+
+
+def _make_tree(root: str, count: int):
+    for i in range(count):
+        with open(os.path.join(root, f"file{i}.txt"), "w") as file:
+            file.write(f"content {i}")
+
+
+def test_run_all_tasks_twice():
+    """同じTaskRunnerでrun_all_tasksを2回実行できるか確認"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _make_tree(tmp_dir, 3)
+        config = Config(
+            logging=LoggingConfig(transfer_log=os.path.join(tmp_dir, "logs", "transfer.jsonl")),
+            aws=AWSConfig(region="us-east-1"),
+            options=UploadOptions(enable_progress=False, exclude_patterns=["logs"]),
+            upload_tasks=[UploadTask(name="dir", source=tmp_dir, bucket="bucket")]
+        )
+        runner = TaskRunner(config)
+        with _stub_s3(runner.s3_client) as calls:
+            assert runner.run_all_tasks() == (1, 0)
+            assert runner.run_all_tasks() == (1, 0)
+
+        puts = [params['Key'] for name, params in calls if name == "PutObject"]
+        assert sorted(puts) == sorted([f"file{i}.txt" for i in range(3)] * 2)
+        with open(config.logging.transfer_log) as file:
+            assert len(file.readlines()) == 6
+    print("✅ run_all_tasksを繰り返し実行できる")
+
+
+def test_aggregate_archive_index():
+    """アーカイブの各メンバーの内容とインデックスのオフセット・サイズが一致するか確認"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, "source")
+        os.makedirs(os.path.join(source, "sub"))
+        _make_tree(source, 3)
+        with open(os.path.join(source, "sub", "large.bin"), "wb") as file:
+            file.write(os.urandom(70000))
+        target = os.path.join(tmp_dir, "target.txt")
+        with open(target, "w") as file:
+            file.write("symlink target")
+        os.symlink(target, os.path.join(source, "link.txt"))
+
+        transfer_log = os.path.join(tmp_dir, "transfer.jsonl")
+        config = Config(
+            logging=LoggingConfig(transfer_log=transfer_log),
+            aws=AWSConfig(region="us-east-1"),
+            options=UploadOptions(enable_progress=False),
+            upload_tasks=[UploadTask(
+                name="archive", source=source, bucket="bucket",
+                s3_key_prefix="archives/", recursive=True, aggregate=True
+            )]
+        )
+        runner = TaskRunner(config)
+        responses = {
+            "CreateMultipartUpload": {"UploadId": "upload-id"},
+            "UploadPart": {"ETag": '"etag"'},
+        }
+        with _stub_s3(runner.s3_client, responses) as calls:
+            assert runner.run_all_tasks() == (1, 0)
+
+        parts = sorted(
+            (params['PartNumber'], params['Body']) for name, params in calls if name == "UploadPart"
+        )
+        archive = b"".join(_body_bytes(body) for _, body in parts)
+        index_put = next(params for name, params in calls if name == "PutObject")
+        assert index_put['Key'] == "archives/source.tar.index.json"
+        index = json.loads(_body_bytes(index_put['Body']))
+
+        expected = {}
+        for root, _, files in os.walk(source):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                with open(path, "rb") as file:
+                    expected[os.path.relpath(path, source).replace(os.sep, "/")] = file.read()
+        assert sorted(index) == sorted(expected)
+
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            for member in tar.getmembers():
+                assert member.isreg(), member.name
+                assert tar.extractfile(member).read() == expected[member.name]
+        for name, (offset, size) in index.items():
+            assert archive[offset:offset + size] == expected[name], name
+
+        with open(transfer_log) as file:
+            records = [json.loads(line) for line in file]
+        assert [(r['key'], r['status'], r['bytes']) for r in records] == [
+            ("archives/source.tar", "uploaded", len(archive)),
+            ("archives/source.tar.index.json", "uploaded", len(_body_bytes(index_put['Body']))),
+        ]
+    print("✅ アーカイブのインデックスが各ファイルの内容と一致")
+
+
+def test_dry_run_skips_auto_tune():
+    """ドライランではauto_tuneが有効でも計測用オブジェクトをアップロードしないか確認"""
+    probed = []
+    original = TransferConfigManager.__dict__["auto_tune"]
+    TransferConfigManager.auto_tune = classmethod(
+        lambda cls, s3_client, bucket, options: probed.append(bucket) or options
+    )
+    try:
+        config = Config(
+            logging=LoggingConfig(),
+            aws=AWSConfig(region="us-east-1"),
+            options=UploadOptions(auto_tune=True, dry_run=True),
+            upload_tasks=[UploadTask(name="dir", source=".", bucket="bucket")]
+        )
+        TaskRunner(config)
+    finally:
+        TransferConfigManager.auto_tune = original
+    assert probed == []
+    print("✅ ドライランでは回線を計測しない")
+
+
+if __name__ == "__main__":
+    test_run_all_tasks_twice()
+    test_aggregate_archive_index()
+    test_dry_run_skips_auto_tune()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""転送設定のテスト"""
+import queue
+
+import boto3
+
+from s3_uploader.core.transfer import BufferPool, TransferConfigManager
+from s3_uploader.core.uploader import UploadExecutor
+from s3_uploader.models.config import UploadOptions
+from test_task_runner import _stub_s3
+
+
+def test_buffer_pool_reuses_buffers():
+    """バッファを上限数までしか確保せず、返却されたものを再利用するか確認"""
+    pool = BufferPool(2, 1024)
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second and len(first) == len(second) == 1024
+    try:
+        pool.acquire(timeout=0.01)
+        raise AssertionError("acquire should wait for a released buffer")
+    except queue.Empty:
+        pass
+
+    pool.release(first)
+    assert pool.acquire(timeout=0.01) is first
+    print("✅ バッファプールが上限数のバッファを再利用")
+
+
+def test_shared_config_part_limits():
+    """共有TransferConfigとパート並列アップロードの同時転送パート数の上限を確認"""
+    options = UploadOptions(parallel_uploads=4, max_concurrency=4)
+    config = TransferConfigManager.create_shared_config(options)
+    assert config.max_request_concurrency == 16
+
+    # メモリ予算を設定するとパートサイズ10MBで3パートまでに抑える
+    budgeted = UploadOptions(parallel_uploads=4, max_concurrency=4, memory_budget_mb=30)
+    executor = UploadExecutor(boto3.client("s3", region_name="us-east-1"), budgeted)
+    try:
+        assert executor.transfer_config.max_request_concurrency == 3
+        assert executor.multipart_uploader.max_workers == 3
+        # aggregateのアーカイブ送信でメモリ上に保持するパート数も同じ上限
+        with _stub_s3(executor.s3_client, {'CreateMultipartUpload': {'UploadId': 'id'}}):
+            writer = executor.multipart_uploader.open_stream("bucket", "key")
+            try:
+                assert writer._slots._value == 3
+            finally:
+                writer.abort()
+        buffers = [executor.multipart_uploader.buffer_pool.acquire() for _ in range(3)]
+        try:
+            executor.multipart_uploader.buffer_pool.acquire(timeout=0.01)
+            raise AssertionError("buffer pool should hold at most 3 buffers")
+        except queue.Empty:
+            pass
+        assert all(len(buffer) == budgeted.multipart_chunksize for buffer in buffers)
+    finally:
+        executor.close()
+    print("✅ メモリ予算内に同時転送パート数とバッファ数を抑える")
+
+
+class FailingPutClient:
+    """計測用オブジェクトのPUTが失敗するS3クライアント"""
+
+    def __init__(self):
+        self.deleted = []
+
+    def head_bucket(self, **kwargs):
+        return {}
+
+    def put_object(self, **kwargs):
+        raise ConnectionError("connection reset")
+
+    def delete_object(self, Bucket, Key):
+        self.deleted.append(Key)
+
+
+def test_auto_tune_deletes_probe_on_failure():
+    """計測に失敗しても計測用オブジェクトを削除し、元の設定を返すか確認"""
+    client = FailingPutClient()
+    options = UploadOptions(auto_tune=True)
+    tuned = TransferConfigManager.auto_tune(client, "bucket", options)
+
+    assert tuned is options
+    assert len(client.deleted) == 1
+    assert client.deleted[0].startswith(TransferConfigManager.PROBE_KEY_PREFIX)
+    print("✅ 計測失敗時も計測用オブジェクトを削除")
+
+
+if __name__ == "__main__":
+    test_buffer_pool_reuses_buffers()
+    test_shared_config_part_limits()
+    test_auto_tune_deletes_probe_on_failure()
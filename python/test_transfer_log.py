@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""転送ログのテスト"""
+import json
+import os
+import tempfile
+import threading
+
+from s3_uploader.utils.transfer_log import TransferLogger
+
+
+def test_transfer_log_records():
+    """複数スレッドから記録した結果が1行1件のJSONとして全て書き出されるか確認"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "logs", "transfer.jsonl")
+        transfer_logger = TransferLogger(path)
+
+        def record(thread_id):
+            for i in range(100):
+                error = "AccessDenied" if i == 0 else None
+                status = "failed" if error else "uploaded"
+                transfer_logger.record(f"/src/{thread_id}/{i}", "bucket", f"{thread_id}/{i}",
+                                       status, i, error)
+
+        threads = [threading.Thread(target=record, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        transfer_logger.close()
+
+        with open(path, encoding="utf-8") as file:
+            records = [json.loads(line) for line in file]
+
+    assert len(records) == 400
+    assert {record["key"] for record in records} == {f"{n}/{i}" for n in range(4) for i in range(100)}
+    failed = [record for record in records if record["status"] == "failed"]
+    assert len(failed) == 4 and all(record["error"] == "AccessDenied" for record in failed)
+    assert all("error" not in record for record in records if record["status"] == "uploaded")
+    print("✅ 転送結果が全てJSONLで記録される")
+
+
+def test_transfer_loggers_are_independent():
+    """同時に存在する2つの転送ログが、それぞれ自分のファイルへ記録するか確認"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        first_path = os.path.join(tmp_dir, "first.jsonl")
+        second_path = os.path.join(tmp_dir, "second.jsonl")
+        first = TransferLogger(first_path)
+        second = TransferLogger(second_path)
+        first.record("/src/a", "bucket", "a", "uploaded", 1)
+        second.record("/src/b", "bucket", "b", "uploaded", 2)
+        first.close()
+        second.close()
+
+        with open(first_path, encoding="utf-8") as file:
+            assert [json.loads(line)["key"] for line in file] == ["a"]
+        with open(second_path, encoding="utf-8") as file:
+            assert [json.loads(line)["key"] for line in file] == ["b"]
+    print("✅ 転送ログのインスタンスごとに別のファイルへ記録される")
+
+
+if __name__ == "__main__":
+    test_transfer_log_records()
+    test_transfer_loggers_are_independent()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""アップロード実行のテスト（S3へのリクエストはbotocoreのイベントで応答を差し替える）"""
+import os
+import tempfile
+import time
+
+import boto3
+
+from s3_uploader.core.uploader import ParallelUploadExecutor, UploadExecutor
+from s3_uploader.models.config import UploadOptions
+from s3_uploader.utils.compression import compression_available
+from s3_uploader.utils.file_utils import FileScanner
+from test_task_runner import _make_tree, _stub_s3
+
+
+def test_skip_unchanged_compressed():
+    """圧縮してアップロードしたファイルが、変更がなければスキップされるか確認"""
+    if not compression_available():
+        print("zstandardがないためスキップ")
+        return
+        
+    s3_client = boto3.client(
+        's3', region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test"
+    )
+    executor = UploadExecutor(
+        s3_client, UploadOptions(enable_progress=False, compress=True, skip_unchanged=True)
+    )
+    scanner = FileScanner()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "data.json")
+        with open(path, "w") as file:
+            file.write('{"key": "value"}' * 100)
+            
+        # 1回目: HEADが404相当（Metadataなし・サイズ不一致）なのでアップロードする
+        with _stub_s3(s3_client, {"HeadObject": {"ContentLength": 0}}) as calls:
+            result = executor.upload_file(scanner.get_file_info(path), "bucket", "data.json")
+        assert result.success and not result.skipped
+        put = next(params for name, params in calls if name == "PutObject")
+        assert put['ContentEncoding'] == 'zstd'
+        
+        # 2回目: アップロード時のメタデータが返れば、圧縮後のサイズ・ETagに関わらずスキップする
+        head = {"ContentLength": 123, "ETag": '"compressed"', "Metadata": put['Metadata']}
+        with _stub_s3(s3_client, {"HeadObject": head}) as calls:
+            result = executor.upload_file(scanner.get_file_info(path), "bucket", "data.json")
+        assert result.skipped
+        assert [name for name, _ in calls] == ["HeadObject"]
+        
+        # ファイルが変わればアップロードする
+        with open(path, "a") as file:
+            file.write(" ")
+        with _stub_s3(s3_client, {"HeadObject": head}) as calls:
+            result = executor.upload_file(scanner.get_file_info(path), "bucket", "data.json")
+        assert result.success and not result.skipped
+    executor.close()
+    print("✅ 圧縮済みオブジェクトの変更判定")
+
+
+def test_parallel_upload_does_not_wait_for_each_transfer():
+    """TransferManagerに渡すファイルの転送を、ワーカーが1件ずつ待たずに重ねて進めるか確認"""
+    s3_client = boto3.client(
+        's3', region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test"
+    )
+    executor = UploadExecutor(
+        s3_client, UploadOptions(enable_progress=False, multipart_threshold=1)
+    )
+    scanner = FileScanner()
+    delay = 0.2
+
+    def slow_part(**kwargs):
+        time.sleep(delay)
+
+    responses = {
+        "CreateMultipartUpload": {"UploadId": "upload-id"},
+        "UploadPart": {"ETag": '"etag"'},
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _make_tree(tmp_dir, 5)
+        items = [
+            (file_info, "bucket", file_info.relative_path)
+            for file_info in scanner.scan_directory(tmp_dir)
+        ]
+        s3_client.meta.events.register('before-parameter-build.s3.UploadPart', slow_part)
+        with _stub_s3(s3_client, responses) as calls, \
+                ParallelUploadExecutor(executor, max_workers=1) as parallel_executor:
+            start = time.monotonic()
+            assert parallel_executor.upload_files(items) == (5, 0)
+            elapsed = time.monotonic() - start
+    executor.close()
+
+    completed = sorted(params['Key'] for name, params in calls if name == "CompleteMultipartUpload")
+    assert completed == sorted(key for _, _, key in items)
+    # 1件ずつ待つと delay × 5 以上かかる
+    assert elapsed < delay * 4, elapsed
+    print(f"✅ ワーカー1つで5件の転送を重ねて実行（{elapsed:.2f}秒）")
+
+
+if __name__ == "__main__":
+    test_skip_unchanged_compressed()
+    test_parallel_upload_does_not_wait_for_each_transfer()